@@ -0,0 +1,69 @@
+# 对比 pages/ 单文件和压缩段归档（--archive）的写入速度、磁盘占用和整批读取速度
+#   python bench/bench_archive.py --count 20000
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yibentong
+from stub_server import render_problem
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def bench(label, ids, pages):
+    t0 = time.perf_counter()
+    for pid in ids:
+        yibentong.save_raw_page(pid, pages[pid])
+    write = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    if yibentong.RAW_ARCHIVE is not None:
+        # 与 --reparse 相同：一次定位全部记录，再按物理顺序读取
+        loaded = ((int(key.split(':', 1)[1]), yibentong.RAW_ARCHIVE.read(row)[0].decode('utf-8'))
+                  for key, row in yibentong.RAW_ARCHIVE.locate(yibentong.page_key(pid) for pid in ids))
+    else:
+        loaded = ((pid, yibentong.load_raw_page(pid)) for pid in ids)
+    for pid, page in loaded:
+        if page != pages[pid]:
+            raise SystemExit(f'{label}: 题目 {pid} 读回内容不一致')
+    read = time.perf_counter() - t0
+    return write, read
+
+def main():
+    parser = argparse.ArgumentParser(description='原始页面归档基准')
+    parser.add_argument('--count', type=int, default=5000)
+    args = parser.parse_args()
+
+    ids = list(range(1000, 1000+args.count))
+    pages = {pid: render_problem(pid) for pid in ids}
+    raw = sum(len(p.encode('utf-8')) for p in pages.values())
+    print(f'{len(ids)} 页，原始大小 {raw/1024**2:.1f} MB')
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            write, read = bench('pages/', ids, pages)
+            print(f'{"pages/ 单文件":<16} 写入 {len(ids)/write:8.0f} 页/秒  读取 {len(ids)/read:8.0f} 页/秒  '
+                  f'占用 {dir_size(yibentong.RAW_PAGE_DIR)/1024**2:6.1f} MB')
+            yibentong.RAW_ARCHIVE = yibentong.PageArchive('archive')
+            try:
+                write, read = bench('archive', ids, pages)
+                codec = yibentong.RAW_ARCHIVE.codec
+            finally:
+                yibentong.RAW_ARCHIVE.close()
+                yibentong.RAW_ARCHIVE = None
+            print(f'{"归档 (" + codec + ")":<16} 写入 {len(ids)/write:8.0f} 页/秒  读取 {len(ids)/read:8.0f} 页/秒  '
+                  f'占用 {dir_size("archive")/1024**2:6.1f} MB')
+        finally:
+            os.chdir(cwd)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
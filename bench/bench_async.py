@@ -0,0 +1,60 @@
+# 对比 ThreadPoolExecutor 路径、两阶段流水线与 --async 引擎在本地桩服务器上的吞吐量
+#   python bench/bench_async.py --count 300 --latency 0.05
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yibentong
+from stub_server import start_server
+
+def run(label, fn, ids):
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results, failed = fn(ids)
+            elapsed = time.perf_counter() - t0
+        finally:
+            os.chdir(cwd)
+    print(f'{label:<34} {len(ids)/elapsed:8.1f} 题/秒  耗时 {elapsed:6.2f}s  成功 {len(results)}  失败 {len(failed)}')
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='异步引擎吞吐量基准')
+    parser.add_argument('--count', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--inflight', type=int, default=100)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    server, url = start_server(latency=args.latency)
+    yibentong.BASE_URL = url
+    ids = list(range(1000, 1000+args.count))
+    print(f'桩服务器 {url}，{args.count} 题，每请求延迟 {args.latency}s')
+    try:
+        threaded = run(f'ThreadPool(workers={args.workers})',
+                       lambda l: yibentong.crawl_ids_concurrent(l, max_workers=args.workers, rate_delay=0), ids)
+        threaded_wide = run(f'ThreadPool(workers={args.inflight})',
+                            lambda l: yibentong.crawl_ids_concurrent(l, max_workers=args.inflight, rate_delay=0), ids)
+        pipelined = run(f'pipeline(io={args.workers}, parse=all cores)',
+                        lambda l: yibentong.crawl_ids_pipelined(l, max_workers=args.workers, rate_delay=0), ids)
+        asynced = run(f'async(inflight={args.inflight})',
+                      lambda l: yibentong.crawl_ids_async(l, max_inflight=args.inflight, rate_delay=0), ids)
+    finally:
+        server.shutdown()
+    same = threaded == asynced == threaded_wide == pipelined
+    print('输出一致' if same else '输出不一致！')
+    return 0 if same else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
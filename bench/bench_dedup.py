@@ -0,0 +1,81 @@
+# 近似重复检测基准：合成 N 道互不相同的题目，再按比例加入改写过的副本（调整数据范围、改排版、增删一句话），
+# 统计 MinHash/LSH 检测的耗时、召回率和误报数
+#   python bench/bench_dedup.py --count 10000 --dup-rate 0.1
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yibentong
+
+WORDS = ('给定', '整数', '序列', '求', '最大', '最小', '字符串', '矩阵', '路径', '个数', '输出', '方案', '每行', '之和',
+         '相邻', '元素', '区间', '查询', '修改', '树', '节点', '边权', '图', '连通', '排序', '子串', '回文', '质数',
+         '游戏', '玩家', '硬币', '背包', '容量', '价值', '物品', '时间', '距离', '城市', '道路', '花费', '长度', '高度')
+
+def make_problem(rng, pid):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(60, 160))]
+    sentences = ['，'.join(words[i:i+8]) + '。' for i in range(0, len(words), 8)]
+    n = rng.randint(10, 10**6)
+    return {
+        'title': f'{pid}：{rng.choice(WORDS)}{rng.choice(WORDS)}{rng.choice(WORDS)}',
+        'description': ''.join(f'<p>{s}</p>' for s in sentences),
+        'input': f'<p>第一行一个整数 n（n≤{n}）。</p>',
+        'output': '<p>输出一个整数。</p>',
+        'sample_input': ' '.join(str(rng.randint(1, 100)) for _ in range(rng.randint(2, 8))),
+        'sample_output': str(rng.randint(1, 1000)),
+    }
+
+def make_variant(rng, pid, data):
+    variant = dict(data, title=f'{pid}：' + data['title'].split('：', 1)[1])
+    kind = rng.randrange(3)
+    if kind == 0:
+        # 同一题换了数据范围
+        variant['input'] = f'<p>第一行一个整数 n（n≤{rng.randint(10, 10**6)}）。</p>'
+    elif kind == 1:
+        # 排版不同：段落合并、标点和空白变化
+        variant['description'] = '<div>' + data['description'].replace('<p>', ' ').replace('</p>', '\n').replace('，', ', ') + '</div>'
+    else:
+        # 多一句提示
+        variant['description'] = data['description'] + '<p>提示：注意答案可能很大。</p>'
+    return variant
+
+def main():
+    parser = argparse.ArgumentParser(description='近似重复检测基准')
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--dup-rate', type=float, default=0.1)
+    parser.add_argument('--threshold', type=float, default=0.8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    rng = random.Random(args.seed)
+    problems = {}
+    originals = {}
+    for pid in range(1000, 1000 + args.count):
+        if originals and rng.random() < args.dup_rate:
+            src = rng.choice(list(originals)[-500:])
+            problems[str(pid)] = make_variant(rng, pid, problems[str(src)])
+            originals[pid] = originals[src]
+        else:
+            problems[str(pid)] = make_problem(rng, pid)
+            originals[pid] = pid
+
+    t0 = time.perf_counter()
+    clusters, total = yibentong.find_duplicates(problems, args.threshold)
+    elapsed = time.perf_counter() - t0
+
+    expected = {pid for pid, src in originals.items() if src != pid}
+    found = {pid for _, dups in clusters for pid, _ in dups}
+    # 误报：被并入了不同原题的簇
+    false_pos = sum(1 for keep, dups in clusters for pid, _ in dups if originals[pid] != originals[keep])
+    print(f'{total} 道题，注入重复 {len(expected)} 道，阈值 {args.threshold}')
+    print(f'耗时 {elapsed:.2f}s（{total/elapsed:.0f} 题/秒），{len(clusters)} 个簇，检出重复 {len(found)} 道')
+    print(f'召回率 {len(found & expected)/max(len(expected), 1)*100:.1f}%，误报 {false_pos} 道')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+# 对比生成 SQL 文件与 --load 直接写入 SQLite 的耗时
+#   python bench/bench_load.py --count 20000 --batch 500
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yibentong
+from stub_server import render_problem
+
+def main():
+    parser = argparse.ArgumentParser(description='直接写库基准')
+    parser.add_argument('--count', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=500)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    yibentong.SKIP_IMAGES = True
+    problems = {str(pid): yibentong.parse_problem_page(render_problem(pid), pid, '', None)
+                for pid in range(1000, 1000+args.count)}
+    print(f'{len(problems)} 道题，每批 {args.batch} 行')
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                t0 = time.perf_counter()
+                sql_file = yibentong.create_sql_file(problems, 1000, 999+args.count, args.batch, 1)
+                sql = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                yibentong.load_problems(problems, 'sqlite:///jol.db', args.batch)
+                load = time.perf_counter() - t0
+            print(f'{"生成 SQL 文件":<16} {len(problems)/sql:8.0f} 题/秒  文件 {os.path.getsize(sql_file)/1024**2:6.1f} MB')
+            print(f'{"--load SQLite":<16} {len(problems)/load:8.0f} 题/秒  库 {os.path.getsize("jol.db")/1024**2:6.1f} MB')
+        finally:
+            os.chdir(cwd)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+# 内存基准：10k 道题常驻内存时，原来的 dict（HTML + 纯文本副本）与 ProblemRecord 的占用对比
+#   python bench/bench_memory.py --count 10000
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yibentong
+from stub_server import render_problem
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    data = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return data, size
+
+def main():
+    parser = argparse.ArgumentParser(description='题目记录内存基准')
+    parser.add_argument('--count', type=int, default=10000)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    yibentong.SKIP_IMAGES = True
+    pages = [(pid, render_problem(pid)) for pid in range(1000, 1000+args.count)]
+    # 先解析一遍，两种布局都从同一份 JSON 文本构建，各自持有独立的字符串
+    payload = [(pid, json.dumps(yibentong.problem_dict(yibentong.parse_problem_page(page, pid, '', None)), ensure_ascii=False))
+               for pid, page in pages]
+    del pages
+
+    dicts, dict_size = measure(lambda: {str(pid): json.loads(p) for pid, p in payload})
+    records, record_size = measure(lambda: {str(pid): yibentong.ProblemRecord.from_dict(json.loads(p)) for pid, p in payload})
+    if any(records[k] != dicts[k] for k in dicts):
+        print('ProblemRecord 与原 dict 内容不一致')
+        return 1
+    overrides = sum(1 for r in records.values() if isinstance(r, yibentong.ProblemRecord) and r.texts not in (None, yibentong._NO_TEXT_OVERRIDES))
+    print(f'{len(dicts)} 道题')
+    print(f'{"dict":<14} {dict_size/1024**2:8.1f} MB  每题 {dict_size/len(dicts):8.0f} B')
+    print(f'{"ProblemRecord":<14} {record_size/1024**2:8.1f} MB  每题 {record_size/len(dicts):8.0f} B  '
+          f'节省 {100*(1-record_size/dict_size):4.1f}%  保存原纯文本 {overrides} 题')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# 页面解析 CPU 基准：在保存的页面语料上对比各解析后端，并检查解析结果与 bs4 后端是否一致
+#   python bench/bench_parse.py                       # 使用桩服务器生成的合成页面
+#   python bench/bench_parse.py --corpus pages/       # 使用目录下保存的 *.html 页面
+#   python bench/bench_parse.py --http-cache http_cache  # 使用 --http-cache 缓存的题目页面
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yibentong
+from stub_server import render_problem
+
+def load_corpus(args):
+    pages = []
+    if args.corpus:
+        for path in sorted(glob.glob(os.path.join(args.corpus, '*.html'))):
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                pid = ''.join(ch for ch in os.path.basename(path) if ch.isdigit()) or '0'
+                pages.append((int(pid), f.read()))
+    elif args.http_cache:
+        conn = sqlite3.connect(os.path.join(args.http_cache, 'index.db'))
+        for url, sha in conn.execute("SELECT url, sha256 FROM entries WHERE url LIKE '%problem_show.php?pid=%'"):
+            with open(os.path.join(args.http_cache, 'objects', sha[:2], sha), 'rb') as f:
+                pages.append((int(url.rsplit('=', 1)[1]), f.read().decode('utf-8', errors='replace')))
+        conn.close()
+    else:
+        pages = [(pid, render_problem(pid)) for pid in range(1000, 1000+args.count)]
+    return pages + edge_cases()
+
+def edge_cases(pid=1003):
+    # 合成页面没有覆盖的写法：注释、处理指令、XML 声明、<h3> 内的块级标签；任何语料都附带这几页，保证一致性检查覆盖到
+    page = render_problem(pid)
+    return [
+        (pid, page.replace('合成题目', '合成<!-- t -->题目').replace('时间限制: 1000 ms', '<!-- limits -->时间限制: 3000 ms')
+                  .replace('内存限制: 65536 KB', '内存限制: 131072 KB').replace('<pre>3', '<pre><!-- n -->3')),
+        (pid, page.replace('合成题目', '合成<?php echo 1 ?>题目')),
+        (pid, '<?xml version="1.0" encoding="gbk"?>\n' + page),
+        (pid, page.replace(f'<h3>{pid}：合成题目 {pid}</h3>', f'<h3><p>{pid}：合成题目</p> {pid}</h3>')),
+    ]
+
+def timed(fn, pages, rounds):
+    t0 = time.process_time()
+    for _ in range(rounds):
+        for pid, page in pages:
+            fn(pid, page)
+    return (time.process_time() - t0) / rounds
+
+def main():
+    parser = argparse.ArgumentParser(description='页面解析 CPU 基准')
+    parser.add_argument('--corpus')
+    parser.add_argument('--http-cache')
+    parser.add_argument('--count', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    yibentong.SKIP_IMAGES = True
+    pages = load_corpus(args)
+    if not pages:
+        print('语料为空')
+        return 1
+    size = sum(len(p) for _, p in pages)
+    print(f'语料: {len(pages)} 页（含 {len(edge_cases())} 页边界写法），{size/1024:.0f} KB，每个后端 {args.rounds} 轮')
+
+    backends = ['bs4', 'stdlib']
+    try:
+        import lxml  # noqa: F401
+        backends.append('lxml')
+    except ImportError:
+        print('未安装 lxml，跳过 lxml 后端')
+
+    # 边界写法的页面与语料中的题号可能重复，按位置对照
+    reference = [yibentong.parse_problem_page(page, pid, '', None, backend='bs4') for pid, page in pages]
+    base = None
+    status = 0
+    for backend in backends:
+        scan = timed(lambda pid, page: yibentong.scan_problem_page(page, backend), pages, args.rounds)
+        full = timed(lambda pid, page: yibentong.parse_problem_page(page, pid, '', None, backend=backend), pages, args.rounds)
+        mismatches = sum(1 for (pid, page), ref in zip(pages, reference)
+                         if yibentong.parse_problem_page(page, pid, '', None, backend=backend) != ref)
+        base = base or full
+        print(f'{backend:<8} 扫描 {len(pages)/scan:8.0f} 页/秒  完整解析 {len(pages)/full:8.0f} 页/秒  '
+              f'加速 {base/full:5.2f}x  与 bs4 不一致 {mismatches}')
+        if mismatches:
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+# 全文索引基准：建立 N 道题的索引，测量增量更新和检索耗时，并与读取 JSON 快照后逐题扫描对比
+#   python bench/bench_search.py --count 10000
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yibentong
+from stub_server import render_problem
+
+QUERIES = ('整数', '求它们的和', '输出', '合成题目 5000', '5000', '合成题目 1234')
+
+def main():
+    parser = argparse.ArgumentParser(description='全文索引基准')
+    parser.add_argument('--count', type=int, default=10000)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    yibentong.SKIP_IMAGES = True
+    problems = [(pid, yibentong.parse_problem_page(render_problem(pid), pid, '', None)) for pid in range(1000, 1000+args.count)]
+    with tempfile.TemporaryDirectory() as tmp:
+        json_file = os.path.join(tmp, 'problems.json')
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump({str(pid): yibentong.problem_dict(p) for pid, p in problems}, f, ensure_ascii=False, indent=2)
+        index = yibentong.SearchIndex(os.path.join(tmp, 'search_index.db'))
+        try:
+            t0 = time.perf_counter()
+            index.update_many(problems)
+            build = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            unchanged = index.update_many(problems)
+            refresh = time.perf_counter() - t0
+            print(f'{len(index)} 道题：建立索引 {build:.2f} 秒，无变化时增量更新 {refresh:.2f} 秒（更新 {unchanged} 项），'
+                  f'索引 {os.path.getsize(index.path)/1024**2:.1f} MB，JSON {os.path.getsize(json_file)/1024**2:.1f} MB')
+            for query in QUERIES:
+                t0 = time.perf_counter()
+                hits = index.search(query, limit=20)
+                indexed = time.perf_counter() - t0
+                # 不建索引时的做法：读出 JSON 快照，逐题在文本里查找
+                t0 = time.perf_counter()
+                with open(json_file, encoding='utf-8') as f:
+                    data = json.load(f)
+                keywords = query.lower().split()
+                scanned = sum(1 for p in data.values() if p.get('exists', True)
+                              and all(k in yibentong.search_text(p).lower() for k in keywords))
+                scan = time.perf_counter() - t0
+                print(f'{query:<12} 索引 {indexed*1000:7.1f} ms（前 {len(hits)} 条）  读 JSON 扫描 {scan*1000:8.1f} ms（{scanned} 条）')
+        finally:
+            index.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
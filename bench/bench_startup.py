@@ -0,0 +1,140 @@
+# 启动时间基准：在全新解释器中测量 import yibentong 和不联网命令（--json-only、search）的耗时，
+# 并用 -X importtime 检查这些路径没有加载只有爬取才需要的库（requests、bs4、asyncio、multiprocessing 等）。
+# 可保存结果作为基线，之后与基线对比，耗时退化超过阈值或加载了这些库时返回非零，供 CI 使用
+#   python bench/bench_startup.py --top 15
+#   python bench/bench_startup.py --save startup.json
+#   python bench/bench_startup.py --baseline startup.json --tolerance 0.2
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import yibentong
+from stub_server import render_problem
+
+YBT = os.path.join(ROOT, 'yibentong.py')
+
+# 不联网的命令不应加载的模块
+HEAVY = ('ybt_http', 'requests', 'urllib3', 'bs4', 'lxml', 'aiohttp', 'asyncio', 'multiprocessing',
+         'concurrent.futures.thread', 'concurrent.futures.process', 'PIL', 'zstandard', 'pymysql')
+
+# 场景名 -> 解释器参数；新增不联网的命令时在这里加一行
+SCENARIOS = {
+    'python': lambda a: ['-c', 'pass'],
+    'import': lambda a: ['-c', 'import yibentong'],
+    'json-only': lambda a: [YBT, str(a.start), str(a.end), '--json-only'],
+    'json-only -m': lambda a: ['-m', 'yibentong', str(a.start), str(a.end), '--json-only'],
+    'search': lambda a: [YBT, 'search', '合成', '--index', 'search_index.db'],
+}
+
+def import_times(cmd, cwd, env):
+    # -X importtime 的输出：每个模块一行 "self | 累计 | 模块名"，模块名前的缩进表示导入层级
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + cmd, cwd=cwd, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = {}
+    for line in proc.stderr.splitlines():
+        parts = line[len('import time:'):].split('|') if line.startswith('import time:') else ()
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+        modules[parts[2].strip()] = (int(parts[0]), int(parts[1]), depth)
+    return modules
+
+def run_scenario(name, cmd, args, cwd, env):
+    # 先跑一次写好字节码缓存，之后取多次运行的中位数
+    subprocess.run([sys.executable] + cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    samples = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable] + cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - t0) * 1000)
+    modules = import_times(cmd, cwd, env)
+    return {
+        'scenario': name,
+        'returncode': proc.returncode,
+        'median_ms': round(statistics.median(samples), 1),
+        'min_ms': round(min(samples), 1),
+        'modules': len(modules),
+        'heavy': sorted(m for m in modules if m in HEAVY),
+        'top': sorted(((cum, m) for m, (_, cum, depth) in modules.items() if depth == 0), reverse=True)[:args.top],
+    }
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for r in results:
+        base = baseline.get(r['scenario'])
+        if base and r['median_ms'] > base['median_ms'] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}: {r['median_ms']} ms > 基线 {base['median_ms']} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='启动时间基准')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--start', type=int, default=1000)
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--top', type=int, default=0, metavar='N')
+    parser.add_argument('--save', metavar='PATH')
+    parser.add_argument('--baseline', metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+    args.end = args.start + args.count - 1
+
+    names = [n for n in args.scenarios.split(',') if n]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        print(f'未知场景: {unknown}，可选: {list(SCENARIOS)}')
+        return 2
+    logging.disable(logging.CRITICAL)
+    yibentong.SKIP_IMAGES = True
+    problems = {str(pid): yibentong.problem_dict(yibentong.parse_problem_page(render_problem(pid), pid, '', None))
+                for pid in range(args.start, args.end + 1)}
+    # 子进程允许写字节码缓存，与部署环境一致；-m 方式运行时主模块也能用上缓存
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, f'problems_{args.start}_{args.end}.json'), 'w', encoding='utf-8') as f:
+            json.dump(problems, f, ensure_ascii=False)
+        subprocess.run([sys.executable, YBT, 'index', f'problems_{args.start}_{args.end}.json', '--index', 'search_index.db'],
+                       cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        print(f'{len(problems)} 道题，每个场景运行 {args.repeat} 次')
+        print(f'{"场景":<14} {"中位数":>9} {"最快":>9} {"模块数":>6}  重量级模块')
+        for name in names:
+            r = run_scenario(name, SCENARIOS[name](args), args, tmp, env)
+            results.append(r)
+            print(f"{name:<14} {r['median_ms']:7.1f}ms {r['min_ms']:7.1f}ms {r['modules']:6}  {', '.join(r['heavy']) or '-'}"
+                  + ('' if r['returncode'] == 0 else f"  退出码 {r['returncode']}"))
+            for cum, module in r['top']:
+                print(f'    {cum/1000:7.1f}ms  {module}')
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({r['scenario']: {k: v for k, v in r.items() if k != 'top'} for r in results}, f, ensure_ascii=False, indent=2)
+        print(f'已保存基线: {args.save}')
+    status = 0 if all(r['returncode'] == 0 for r in results) else 1
+    for r in results:
+        if r['heavy']:
+            print(f"{r['scenario']}: 加载了爬取才需要的模块 {', '.join(r['heavy'])}")
+            status = 1
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f'启动时间退化: {line}')
+        if regressions:
+            status = 1
+        else:
+            print(f'与基线相比没有超过 {args.tolerance*100:.0f}% 的退化')
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# 离线基准套件：在本地桩服务器上逐个运行各抓取引擎（独立子进程），报告吞吐量、抓取延迟 p50/p99、CPU 时间和峰值 RSS。
+# 可保存结果作为基线，之后与基线对比，退化超过阈值时返回非零，供 CI 使用
+#   python bench/bench_suite.py --count 300 --latency 0.05 --error-rate 0.02 --burst-every 5 --burst-length 0.5
+#   python bench/bench_suite.py --scenario fault      # 429 突发 + 5% 错误，每个引擎须在时限内完成
+#   python bench/bench_suite.py --save baseline.json
+#   python bench/bench_suite.py --baseline baseline.json --tolerance 0.2
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from stub_server import start_server
+
+YBT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'yibentong.py')
+
+# 引擎名 -> 额外的命令行参数；新增引擎时在这里加一行
+ENGINES = {
+    'sequential': lambda a: [],
+    'concurrent': lambda a: ['--concurrent', str(a.workers)],
+    'pipeline': lambda a: ['--concurrent', str(a.workers), '--parse-workers', str(a.parse_workers)],
+    'async': lambda a: ['--async', str(a.inflight)],
+}
+
+# 故障场景 -> 桩服务器参数和每题耗时上限（秒）；每个引擎的时限为 per_problem*题数+10 秒，超时的引擎被终止并记为失败
+SCENARIOS = {
+    'fault': {'latency': 0.05, 'error_rate': 0.05, 'burst_every': 5.0, 'burst_length': 0.5, 'per_problem': 0.4},
+}
+
+def run_engine(name, extra, args, url):
+    with tempfile.TemporaryDirectory() as tmp:
+        cmd = [sys.executable, YBT, str(args.start), str(args.start+args.count-1), '--base-url', url,
+               '--rate', '0', '--progress', '0', '--metrics', 'metrics.json'] + extra
+        if args.no_image:
+            cmd.append('--no-image')
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timer = threading.Timer(args.time_limit, proc.kill) if args.time_limit else None
+        if timer:
+            timer.start()
+        # wait4 取得该子进程自己的资源占用（CPU 时间含其已回收的解析子进程）
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        elapsed = time.perf_counter() - t0
+        if timer:
+            timer.cancel()
+        try:
+            with open(os.path.join(tmp, 'metrics.json'), encoding='utf-8') as f:
+                metrics = json.load(f)
+        except (OSError, ValueError):
+            metrics = {'stages': {}, 'counters': {}}
+    fetch = metrics['stages'].get('fetch', {})
+    counters = metrics['counters']
+    # ru_maxrss 在 Linux 上以 KB 为单位，macOS 上以字节为单位
+    rss_mb = usage.ru_maxrss / (1024**2 if sys.platform == 'darwin' else 1024)
+    return {
+        'engine': name,
+        'returncode': proc.returncode,
+        'timed_out': bool(args.time_limit) and elapsed >= args.time_limit,
+        'elapsed': round(elapsed, 3),
+        'throughput': round(args.count / elapsed, 2),
+        'fetch_p50': fetch.get('p50', 0.0),
+        'fetch_p99': fetch.get('p99', 0.0),
+        'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 3),
+        'peak_rss_mb': round(rss_mb, 1),
+        # 传输层（urllib3 / 异步请求）的重试加上 RetryScheduler 安排的题目级重试
+        'retries': sum(sum(counters.get(name, {}).values()) for name in ('http_retries_total', 'retries_scheduled_total')),
+        'failed': counters.get('problems_total', {}).get('result=failed', 0),
+    }
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for r in results:
+        base = baseline.get(r['engine'])
+        if not base:
+            continue
+        if r['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{r['engine']}: 吞吐量 {r['throughput']} < 基线 {base['throughput']}")
+        if r['cpu_seconds'] > base['cpu_seconds'] * (1 + tolerance):
+            regressions.append(f"{r['engine']}: CPU {r['cpu_seconds']}s > 基线 {base['cpu_seconds']}s")
+        if r['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{r['engine']}: 峰值 RSS {r['peak_rss_mb']} MB > 基线 {base['peak_rss_mb']} MB")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='离线基准套件')
+    parser.add_argument('--engines', default=','.join(ENGINES))
+    parser.add_argument('--start', type=int, default=1000)
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--parse-workers', type=int, default=2)
+    parser.add_argument('--inflight', type=int, default=50)
+    parser.add_argument('--no-image', action='store_true')
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--burst-every', type=float, default=0.0, metavar='SEC')
+    parser.add_argument('--burst-length', type=float, default=0.0, metavar='SEC')
+    parser.add_argument('--corpus', metavar='DIR')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--time-limit', type=float, default=0.0, metavar='SEC')
+    parser.add_argument('--save', metavar='PATH')
+    parser.add_argument('--baseline', metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+    if args.scenario:
+        scenario = SCENARIOS[args.scenario]
+        for key in ('latency', 'error_rate', 'burst_every', 'burst_length'):
+            setattr(args, key, scenario[key])
+        args.time_limit = args.time_limit or scenario['per_problem'] * args.count + 10
+
+    names = [n for n in args.engines.split(',') if n]
+    unknown = [n for n in names if n not in ENGINES]
+    if unknown:
+        print(f'未知引擎: {unknown}，可选: {list(ENGINES)}')
+        return 2
+    server, url = start_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                               burst_every=args.burst_every, burst_length=args.burst_length, corpus=args.corpus)
+    print(f'桩服务器 {url}，{args.count} 题，延迟 {args.latency}s±{args.jitter*100:.0f}%，错误率 {args.error_rate}，'
+          f'429 突发 {args.burst_length}s/{args.burst_every}s')
+    print(f'{"引擎":<12} {"题/秒":>8} {"耗时":>8} {"抓取p50":>9} {"抓取p99":>9} {"CPU":>8} {"峰值RSS":>9} {"重试":>6} {"失败":>6}')
+    results = []
+    try:
+        for name in names:
+            r = run_engine(name, ENGINES[name](args), args, url)
+            results.append(r)
+            print(f"{name:<12} {r['throughput']:8.1f} {r['elapsed']:7.2f}s {r['fetch_p50']*1000:7.1f}ms {r['fetch_p99']*1000:7.1f}ms "
+                  f"{r['cpu_seconds']:7.2f}s {r['peak_rss_mb']:7.1f}MB {r['retries']:6} {r['failed']:6}"
+                  + ('' if r['returncode'] == 0 else f"  退出码 {r['returncode']}")
+                  + (f"  超过时限 {args.time_limit:.0f}s" if r['timed_out'] else ''))
+    finally:
+        server.shutdown()
+    stats = {k: v for k, v in server.stats.items() if k != 'lock'}
+    print(f"服务器: 请求 {stats.get('requests', 0)}，注入错误 {stats.get('errors', 0)}，429 {stats.get('throttled', 0)}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({r['engine']: r for r in results}, f, ensure_ascii=False, indent=2)
+        print(f'已保存基线: {args.save}')
+    status = 0 if all(r['returncode'] == 0 for r in results) else 1
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f'性能退化: {line}')
+        if regressions:
+            status = 1
+        else:
+            print(f'与基线相比没有超过 {args.tolerance*100:.0f}% 的退化')
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# 本地桩服务器：按 YBT problem_show.php 的页面结构生成合成题目页面和图片，供基准测试使用
+import argparse
+import glob
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+def make_png(seed, width=96, height=64):
+    # 合成一张灰度"示意图"：按 seed 画不同的网格线；低压缩级别并带 tEXt 元数据，接近站点上未经优化的图片
+    rows = []
+    for y in range(height):
+        row = bytearray([0])
+        for x in range(width):
+            row.append(0 if (x + seed) % 16 == 0 or (y + seed // 16) % 12 == 0 else 255 - (x*y + seed) % 7)
+        rows.append(bytes(row))
+    return (b'\x89PNG\r\n\x1a\n'
+            + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + _png_chunk(b'tEXt', b'Software\x00ybt stub server')
+            + _png_chunk(b'IDAT', zlib.compress(b''.join(rows), 1))
+            + _png_chunk(b'IEND', b''))
+
+def js_escape(text):
+    return text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+MISSING_PAGE = '<html><body><h3>题目不存在</h3></body></html>'
+
+# 成段缺失的题号，模拟站点上的大段空缺
+MISSING_RANGES = ((1100, 1399),)
+
+def render_problem(pid):
+    # 每 7 个 ID 留一个空洞，模拟站点上不存在的题目
+    if pid % 7 == 0 or any(lo <= pid <= hi for lo, hi in MISSING_RANGES):
+        return MISSING_PAGE
+    desc = f'<p>给定 {pid} 个整数，求它们的和。</p>' + '<p>这是一段较长的题目描述。</p>' * 20
+    if pid % 3 == 0:
+        desc += f'<p><img src="/images/{pid}.png"></p>'
+    if pid % 5 == 0:
+        # 多道题共用的图片，用于验证去重
+        desc += '<p><img src="/images/shared.png"></p>'
+    sections = [desc, '<p>第一行一个整数 n。</p>', '<p>输出一个整数。</p>']
+    scripts = ''.join(f'<script>pshow("{js_escape(s)}");</script>' for s in sections)
+    return f'''<html><head><title>YBT</title></head><body>
+<table><tr><td><h3>{pid}：合成题目 {pid}</h3></td></tr>
+<tr><td>时间限制: 1000 ms 内存限制: 65536 KB</td></tr></table>
+<h4>【题目描述】</h4>{scripts}
+<h4>【输入样例】</h4><pre>3
+1 2 3</pre>
+<h4>【输出样例】</h4><pre>6</pre>
+</body></html>'''
+
+def load_corpus(corpus_dir):
+    # 录制的语料：目录下的 {pid}.html（如 --parse-workers 保存的 pages/）
+    pages = {}
+    for path in glob.glob(os.path.join(corpus_dir, '*.html')):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name.isdigit():
+            with open(path, 'rb') as f:
+                pages[int(name)] = f.read()
+    return pages
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 头和正文分两次写出，keep-alive 连接上需关闭 Nagle，否则每个响应多等一个延迟 ACK
+    disable_nagle_algorithm = True
+    latency = 0.0
+    # 延迟在 latency*(1±jitter) 间均匀分布
+    jitter = 0.0
+    # 按概率返回 500/502/503
+    error_rate = 0.0
+    # 每 burst_every 秒中有 burst_length 秒对所有请求返回 429
+    burst_every = 0.0
+    burst_length = 0.0
+    retry_after = 1
+    corpus = None
+    started = 0.0
+    stats = None
+    rng = random.Random(0)
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type):
+        etag = f'"{zlib.crc32(body):08x}"'
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if status == 200:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def count(self, key):
+        with self.stats['lock']:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency * (1 + self.jitter * (2*self.rng.random() - 1)) if self.jitter else self.latency)
+        self.count('requests')
+        if self.burst_every and (time.monotonic() - self.started) % self.burst_every < self.burst_length:
+            self.count('throttled')
+            self.send_response(429)
+            self.send_header('Retry-After', str(self.retry_after))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.count('errors')
+            self.send_body(self.rng.choice((500, 502, 503)), b'injected error', 'text/plain')
+            return
+        parsed = urlparse(self.path)
+        if parsed.path == '/problem_show.php':
+            try:
+                pid = int(parse_qs(parsed.query).get('pid', ['0'])[0])
+            except ValueError:
+                pid = 0
+            if self.corpus is not None:
+                body = self.corpus.get(pid) or MISSING_PAGE.encode('utf-8')
+            else:
+                body = render_problem(pid).encode('utf-8')
+            self.send_body(200, body, 'text/html; charset=utf-8')
+        elif parsed.path.startswith('/images/') or os.path.splitext(parsed.path)[1].lower() in ('.png', '.jpg', '.jpeg', '.gif'):
+            # 录制语料中的图片地址也返回合成图片
+            # 按路径生成，保证每张图片内容不同
+            self.send_body(200, make_png(zlib.crc32(parsed.path.encode()) % 997), 'image/png')
+        else:
+            self.send_body(404, b'not found', 'text/plain')
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+def start_server(host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, burst_every=0.0, burst_length=0.0,
+                 retry_after=1, corpus=None, seed=0):
+    handler = type('Handler', (StubHandler,), {
+        'latency': latency, 'jitter': jitter, 'error_rate': error_rate, 'burst_every': burst_every,
+        'burst_length': burst_length, 'retry_after': retry_after, 'corpus': load_corpus(corpus) if corpus else None,
+        'started': time.monotonic(), 'stats': {'lock': threading.Lock()}, 'rng': random.Random(seed)})
+    server = StubServer((host, port), handler)
+    server.stats = handler.stats
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='YBT 本地桩服务器')
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--burst-every', type=float, default=0.0, metavar='SEC')
+    parser.add_argument('--burst-length', type=float, default=0.0, metavar='SEC')
+    parser.add_argument('--corpus', metavar='DIR')
+    args = parser.parse_args()
+    server, url = start_server(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                               burst_every=args.burst_every, burst_length=args.burst_length, corpus=args.corpus)
+    print(f'桩服务器已启动: {url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
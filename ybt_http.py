@@ -0,0 +1,97 @@
+# HTTP 传输层：依赖 requests / urllib3 的重试计数、限速 adapter、缓存 adapter 和会话构造。
+# 由 yibentong.make_session 在第一次建会话时导入，--json-only、index/search 等不联网的命令不加载 requests。
+# 运行指标由调用方传入（以脚本方式运行时 yibentong 是 __main__，这里不能反向导入）
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+class CountingRetry(Retry):
+    # urllib3 每次重试都会调用 increment，在这里计数
+    def __init__(self, *args, metrics, **kwargs):
+        self.metrics = metrics
+        super().__init__(*args, **kwargs)
+
+    def new(self, **kw):
+        # urllib3 每次重试用 new() 复制出新的 Retry，带上同一个 metrics
+        return super().new(metrics=self.metrics, **kw)
+
+    def increment(self, method=None, url=None, response=None, error=None, *args, **kwargs):
+        self.metrics.inc('http_retries_total', reason=response.status if response is not None else type(error).__name__)
+        return super().increment(method, url, response, error, *args, **kwargs)
+
+class RateLimitedAdapter(HTTPAdapter):
+    # 页面和图片请求都经过 adapter，在这里统一取令牌并向并发控制器反馈延迟和状态码
+    def __init__(self, metrics, limiter=None, controller=None, **kwargs):
+        self.metrics = metrics
+        self.limiter = limiter
+        self.controller = controller
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.limiter:
+            self.limiter.acquire()
+        t0 = time.monotonic()
+        try:
+            resp = super().send(request, **kwargs)
+        except Exception as e:
+            self.metrics.inc('http_errors_total', error=type(e).__name__)
+            if self.controller:
+                self.controller.record(time.monotonic()-t0, None)
+            raise
+        self.metrics.inc('http_responses_total', status=resp.status_code)
+        if self.controller:
+            self.controller.record(time.monotonic()-t0, resp.status_code)
+        return resp
+
+class CachingAdapter(RateLimitedAdapter):
+    # 在限速 adapter 之上加一层条件请求缓存；离线模式下只读缓存，不访问网络
+    def __init__(self, cache, metrics, limiter=None, controller=None, **kwargs):
+        self.cache = cache
+        super().__init__(metrics, limiter, controller, **kwargs)
+
+    def _cached_response(self, request, entry, body):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.reason = 'OK'
+        resp.headers = CaseInsensitiveDict(entry['headers'])
+        resp._content = body
+        resp._content_consumed = True
+        resp.url = request.url
+        resp.request = request
+        resp.connection = self
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        return resp
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+        entry = self.cache.lookup(request.url)
+        if self.cache.offline:
+            if entry is None:
+                raise requests.ConnectionError(f'离线模式下缓存未命中: {request.url}')
+            return self._cached_response(request, entry, self.cache.read(request.url, entry))
+        if entry:
+            request.headers.update(self.cache.conditional_headers(entry))
+        resp = super().send(request, **kwargs)
+        if resp.status_code == 304 and entry:
+            resp.close()
+            return self._cached_response(request, entry, self.cache.read(request.url, entry, revalidated=True))
+        if resp.status_code == 200:
+            self.cache.store(request.url, resp.headers, resp.content)
+        return resp
+
+def make_session(user_agent, retry, metrics, cache=None, limiter=None, controller=None, pool_size=10):
+    session = requests.Session()
+    session.headers.update({
+        'User-Agent': user_agent
+    })
+    if cache is not None:
+        adapter = CachingAdapter(cache, metrics, limiter, controller, max_retries=retry, pool_maxsize=pool_size)
+    else:
+        adapter = RateLimitedAdapter(metrics, limiter, controller, max_retries=retry, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
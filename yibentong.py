@@ -1,5 +1,3 @@
-import requests
-from bs4 import BeautifulSoup
 import re
 import os
 import datetime
@@ -8,18 +6,45 @@ import sys
 import html
 import argparse
 import urllib.parse
+from html.parser import HTMLParser
 from urllib.parse import urljoin
 import hashlib
+import io
+import math
+import glob
+import array
 import logging
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+import heapq
+import queue
+import types
 import json
 import shutil
+import threading
+import sqlite3
+import random
+import codecs
+import socket
+import mmap
+import struct
+import zlib
+from contextlib import contextmanager, nullcontext
+from collections import deque
 
 # 全局选项（由 CLI 设置）
 SKIP_IMAGES = False
 JSON_ONLY = False
+HTTP_CACHE = None
+RAW_ARCHIVE = None
+IMAGE_PROCESSOR = None
+# 页面解析后端：auto / lxml / stdlib / bs4
+PARSER_BACKEND = 'auto'
+
+# 站点地址（基准测试时可指向本地桩服务器）
+BASE_URL = 'http://ybt.ssoier.cn:8088'
+
+def problem_url(problem_id):
+    return f'{BASE_URL}/problem_show.php?pid={problem_id}'
 
 def clean_html_content(content):
     if not content:
@@ -35,6 +60,7 @@ def ensure_paragraph_tags(html_content):
         return html_content
     if '<p>' in html_content or '<div>' in html_content or '<img' in html_content:
         return html_content
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(html_content, 'html.parser')
     text = soup.get_text().strip()
     if not text:
@@ -50,16 +76,908 @@ def ensure_paragraph_tags(html_content):
         return ''.join(html_paragraphs)
     return html_content
 
-def make_session():
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
-    })
-    retry = Retry(total=5, backoff_factor=0.6, status_forcelist=[429,500,502,503,504], allowed_methods=["HEAD","GET","OPTIONS"])
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    return session
+class Metrics:
+    # 运行指标：各阶段耗时（蓄水池采样估算分位数）和带标签的计数器，线程安全
+    RESERVOIR = 4096
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            st = self.stages.get(stage)
+            if st is None:
+                st = self.stages[stage] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'samples': []}
+            st['count'] += 1
+            st['sum'] += seconds
+            st['max'] = max(st['max'], seconds)
+            if len(st['samples']) < self.RESERVOIR:
+                st['samples'].append(seconds)
+            else:
+                i = random.randrange(st['count'])
+                if i < self.RESERVOIR:
+                    st['samples'][i] = seconds
+
+    @contextmanager
+    def timer(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter()-t0)
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def total(self, name):
+        with self.lock:
+            return sum(v for (n, _), v in self.counters.items() if n == name)
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.time() - self.started
+            stages = {}
+            for name, st in sorted(self.stages.items()):
+                samples = sorted(st['samples'])
+                def q(p):
+                    return samples[min(len(samples)-1, int(p*len(samples)))] if samples else 0.0
+                stages[name] = {'count': st['count'], 'sum': round(st['sum'], 6), 'mean': round(st['sum']/st['count'], 6),
+                                'max': round(st['max'], 6), 'p50': round(q(0.5), 6), 'p90': round(q(0.9), 6), 'p99': round(q(0.99), 6)}
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                label_str = ','.join(f'{k}={v}' for k, v in labels)
+                counters.setdefault(name, {})[label_str] = value
+        done = sum(counters.get('problems_total', {}).values())
+        return {'elapsed_seconds': round(elapsed, 3), 'problems_per_second': round(done/elapsed, 3) if elapsed else 0.0,
+                'stages': stages, 'counters': counters}
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+    def write_prometheus(self, path):
+        snap = self.snapshot()
+        lines = ['# TYPE ybt_stage_seconds summary']
+        for stage, st in snap['stages'].items():
+            for q in ('p50', 'p90', 'p99'):
+                lines.append(f'ybt_stage_seconds{{stage="{stage}",quantile="{int(q[1:])/100}"}} {st[q]}')
+            lines.append(f'ybt_stage_seconds_sum{{stage="{stage}"}} {st["sum"]}')
+            lines.append(f'ybt_stage_seconds_count{{stage="{stage}"}} {st["count"]}')
+        for name, series in snap['counters'].items():
+            lines.append(f'# TYPE ybt_{name} counter')
+            for label_str, value in series.items():
+                labels = ','.join(f'{k}="{v}"' for k, v in (kv.split('=', 1) for kv in label_str.split(',') if kv))
+                lines.append(f'ybt_{name}{{{labels}}} {value}' if labels else f'ybt_{name} {value}')
+        lines.append(f'ybt_elapsed_seconds {snap["elapsed_seconds"]}')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+METRICS = Metrics()
+
+class ProgressReporter:
+    # 后台线程定期输出进度：已完成题数、速率和预计剩余时间
+    def __init__(self, total, interval=10.0):
+        self.total = total
+        self.interval = interval
+        self.started = time.time()
+        self.base = METRICS.total('problems_total')
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def line(self):
+        done = METRICS.total('problems_total') - self.base
+        elapsed = max(time.time() - self.started, 1e-6)
+        rate = done / elapsed
+        remaining = (self.total - done) / rate if rate > 0 else float('inf')
+        eta = str(datetime.timedelta(seconds=int(remaining))) if remaining != float('inf') else '未知'
+        percent = 100.0*done/self.total if self.total else 100.0
+        return f'进度 {done}/{self.total} ({percent:.1f}%)，{rate:.2f} 题/秒，预计剩余 {eta}'
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            logging.info(self.line())
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        logging.info(self.line())
+        return False
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
+RETRY_TOTAL = 5
+RETRY_BACKOFF = 0.6
+RETRY_STATUSES = [429,500,502,503,504]
+
+class TokenBucket:
+    # 令牌桶限速器：线程和协程共用。取令牌时只在锁内预约等待时长，真正的等待在锁外进行
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_interval(cls, interval, burst=1):
+        if not interval or interval <= 0:
+            return None
+        return cls(1.0/interval, burst)
+
+    def _reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now-self.updated)*self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens/self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        import asyncio
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+def _wake_future(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+class AdaptiveConcurrency:
+    # AIMD 并发控制：每个统计窗口内延迟和 429/5xx 比例都正常时并发 +1，否则减半。
+    # 线程在 cond 上等待；协程各自等待一个 future，由 release 和 _adjust 经 call_soon_threadsafe 唤醒
+    def __init__(self, initial, maximum, minimum=1, window=20, target_latency=2.0, max_error_rate=0.05):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(self.maximum, max(self.minimum, initial))
+        self.window = window
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.active = 0
+        self.samples = deque()
+        self.cond = threading.Condition()
+        self.async_waiters = deque()
+
+    def record(self, latency, status):
+        # status 为 None 表示连接错误或超时
+        error = status is None or status == 429 or status >= 500
+        with self.cond:
+            self.samples.append((latency, error))
+            # 限流信号立即减半，不必等窗口填满
+            if status == 429 or len(self.samples) >= self.window:
+                self._adjust()
+
+    def _adjust(self):
+        n = len(self.samples)
+        errors = sum(1 for _, e in self.samples if e)
+        latencies = sorted(l for l, _ in self.samples)
+        median = latencies[n//2]
+        self.samples.clear()
+        old = self.limit
+        if errors/n > self.max_error_rate or median > self.target_latency:
+            self.limit = max(self.minimum, self.limit//2)
+        else:
+            self.limit = min(self.maximum, self.limit+1)
+            self.cond.notify_all()
+            self._wake_async(len(self.async_waiters))
+        if self.limit != old:
+            logging.info('自适应并发调整: %s -> %s（错误率 %.2f，延迟中位数 %.2fs）', old, self.limit, errors/n, median)
+
+    def try_acquire(self):
+        with self.cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit:
+                self.cond.wait()
+            self.active += 1
+
+    async def acquire_async(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.cond:
+                if self.active < self.limit:
+                    self.active += 1
+                    return
+                fut = loop.create_future()
+                waiter = (loop, fut)
+                self.async_waiters.append(waiter)
+            try:
+                await fut
+            except BaseException:
+                with self.cond:
+                    if waiter in self.async_waiters:
+                        self.async_waiters.remove(waiter)
+                    else:
+                        # 已被唤醒却取消了，把这次唤醒转给下一个等待者
+                        self._wake_async(1)
+                raise
+
+    def _wake_async(self, n):
+        # 调用方持有 cond
+        for _ in range(min(n, len(self.async_waiters))):
+            loop, fut = self.async_waiters.popleft()
+            loop.call_soon_threadsafe(_wake_future, fut)
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+            self._wake_async(1)
+
+class FetchError(Exception):
+    # 页面请求返回非 200 状态码；retry_after 为服务器给出的 Retry-After 秒数
+    def __init__(self, status, retry_after=None):
+        super().__init__(f'HTTP {status}')
+        self.status = status
+        self.retry_after = retry_after
+
+class ParseError(Exception):
+    # 页面已取到但解析失败：重试也不会成功，直接写入死信
+    def __init__(self):
+        super().__init__('页面解析失败')
+
+def _retry_after(headers):
+    try:
+        return max(0.0, float(headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return None
+
+def _is_retryable(exc):
+    # 限流、服务器错误、超时和连接错误可以重试；解析错误和其他状态码重试也不会成功
+    if isinstance(exc, FetchError):
+        return exc.status in RETRY_STATUSES
+    if HTTP_CACHE is not None and HTTP_CACHE.offline:
+        return False
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    # 只检查已经加载的库的异常类型：没有导入的库不可能抛出这些异常
+    requests = sys.modules.get('requests')
+    if requests is not None and isinstance(exc, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return True
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is not None and isinstance(exc, asyncio.TimeoutError):
+        return True
+    aiohttp = sys.modules.get('aiohttp')
+    return aiohttp is not None and isinstance(exc, aiohttp.ClientError)
+
+def failure_reason(exc):
+    if isinstance(exc, FetchError):
+        return str(exc)
+    return f'{type(exc).__name__}: {exc}'[:200]
+
+class CircuitBreaker:
+    # 熔断器：最近 window 次请求中失败比例达到 threshold 时断开，暂停派发约 cooldown 秒（带抖动，避免试探总落在同一相位）；
+    # 之后只放行一个试探请求（半开），成功则恢复，失败则冷却时间加倍。
+    # 限流（429 / Retry-After）不说明站点不可用，交给限速器、AIMD 并发控制和重试退避处理，不计入熔断
+    def __init__(self, threshold=0.5, window=20, cooldown=30.0, max_cooldown=600.0):
+        self.threshold = threshold
+        self.window = window
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.reopen_at = 0.0
+        self.probing = False
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, ok):
+        # ok 为 None 表示被限流：不计入统计，半开时只交还试探名额
+        with self.lock:
+            if self.state == 'half-open':
+                self.probing = False
+                if ok is None:
+                    return
+                if ok:
+                    self.state = 'closed'
+                    self.cooldown = self.base_cooldown
+                    logging.info('熔断恢复，继续派发请求')
+                else:
+                    self._open(min(self.max_cooldown, self.cooldown*2))
+            elif self.state == 'closed' and ok is not None:
+                self.samples.append(ok)
+                failures = self.samples.count(False)
+                if len(self.samples) >= self.window and failures >= self.threshold*len(self.samples):
+                    self._open(self.base_cooldown)
+
+    def _open(self, cooldown):
+        self.state = 'open'
+        self.cooldown = cooldown
+        pause = cooldown * random.uniform(0.75, 1.25)
+        self.reopen_at = time.monotonic() + pause
+        self.samples.clear()
+        METRICS.inc('circuit_open_total')
+        logging.warning('站点请求大量失败，熔断 %.0f 秒后试探', pause)
+
+    def admit(self):
+        # 返回 0 表示可以派发，否则为建议的等待秒数
+        with self.lock:
+            if self.state == 'closed':
+                return 0.0
+            now = time.monotonic()
+            if self.state == 'open':
+                if now < self.reopen_at:
+                    return self.reopen_at - now
+                self.state = 'half-open'
+            if self.probing:
+                return 0.2
+            self.probing = True
+            return 0.0
+
+    def wait(self):
+        while True:
+            delay = self.admit()
+            if not delay:
+                return
+            time.sleep(delay)
+
+    async def wait_async(self):
+        import asyncio
+        while True:
+            delay = self.admit()
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+class RetryScheduler:
+    # 失败的题号按带抖动的指数退避重新排队：退避期间不占用 worker，其余题目照常派发，到期的重试优先于新题号。
+    # 重试次数用完或不可重试的失败写入死信列表（dead_letter.add_dead）
+    def __init__(self, max_attempts=4, base_delay=2.0, max_delay=120.0, breaker=None, dead_letter=None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self.dead_letter = dead_letter
+
+    def backoff(self, attempt, retry_after=None):
+        # 全抖动：在 [0, base*2^attempt] 内均匀取值；服务器给出 Retry-After 时至少等待该时长
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        return max(delay, retry_after) if retry_after else delay
+
+    def succeeded(self):
+        if self.breaker:
+            self.breaker.record(True)
+
+    def failed(self, problem_id, attempt, exc):
+        # 返回下次重试前的等待秒数；None 表示放弃，已写入死信
+        retryable = _is_retryable(exc)
+        if self.breaker:
+            throttled = isinstance(exc, FetchError) and (exc.status == 429 or exc.retry_after is not None)
+            self.breaker.record(None if throttled else not retryable)
+        reason = failure_reason(exc)
+        if retryable and attempt+1 < self.max_attempts:
+            delay = self.backoff(attempt, getattr(exc, 'retry_after', None))
+            METRICS.inc('retries_scheduled_total')
+            logging.warning('题目 %s 失败（%s），%.1f 秒后重试（第 %s 次尝试）', problem_id, reason, delay, attempt+2)
+            return delay
+        if retryable:
+            logging.error('题目 %s 重试 %s 次仍失败，写入死信: %s', problem_id, attempt+1, reason)
+        else:
+            logging.error('题目 %s 失败，写入死信: %s', problem_id, reason, exc_info=exc)
+        self.give_up(problem_id, attempt, exc)
+        return None
+
+    def give_up(self, problem_id, attempt, exc):
+        # 不再重试，直接写入死信；也用于抓取之后的解析阶段
+        METRICS.inc('dead_letter_total', reason=exc.status if isinstance(exc, FetchError) else type(exc).__name__)
+        if self.dead_letter is not None:
+            self.dead_letter.add_dead(problem_id, failure_reason(exc), attempt+1)
+
+    def run(self, id_list, submit, inflight):
+        # submit(pid) 返回 Future；依次产出 (pid, 结果)，放弃的题号结果为 None。
+        # 同时在途的任务不超过 inflight 个，熔断期间暂停派发
+        fresh = iter(id_list)
+        upcoming = next(fresh, None)
+        retries = []
+        active = {}
+        seq = 0
+        while True:
+            now = time.monotonic()
+            hold = 0.0
+            while len(active) < inflight:
+                due = bool(retries) and retries[0][0] <= now
+                if not due and upcoming is None:
+                    break
+                hold = self.breaker.admit() if self.breaker else 0.0
+                if hold:
+                    break
+                if due:
+                    _, _, pid, attempt = heapq.heappop(retries)
+                else:
+                    pid, attempt = upcoming, 0
+                    upcoming = next(fresh, None)
+                active[submit(pid)] = (pid, attempt)
+            if not active and not retries and upcoming is None:
+                return
+            timeouts = [t for t in (hold, retries[0][0]-now if retries else 0.0) if t > 0]
+            timeout = min(timeouts) if timeouts else None
+            if not active:
+                time.sleep(timeout or 0.0)
+                continue
+            done, _ = wait(active, timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                pid, attempt = active.pop(fut)
+                exc = fut.exception()
+                if exc is None:
+                    self.succeeded()
+                    yield pid, fut.result()
+                    continue
+                delay = self.failed(pid, attempt, exc)
+                if delay is None:
+                    yield pid, None
+                else:
+                    seq += 1
+                    heapq.heappush(retries, (time.monotonic()+delay, seq, pid, attempt+1))
+
+def _completed(fn, *args):
+    # 在当前线程同步执行，包装成已完成的 Future
+    fut = Future()
+    try:
+        fut.set_result(fn(*args))
+    except Exception as e:
+        fut.set_exception(e)
+    return fut
+
+class HttpCache:
+    # 磁盘 HTTP 缓存：索引存 SQLite，正文按 sha256 内容寻址存放，相同内容只存一份。
+    # 命中时带 If-None-Match / If-Modified-Since 重新验证；总大小超过上限时按最近访问时间淘汰
+    KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+    def __init__(self, cache_dir, max_bytes=2*1024**3, offline=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, 'index.db'), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+            url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL,
+            headers TEXT NOT NULL, stored REAL NOT NULL, accessed REAL NOT NULL)""")
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self.conn.commit()
+        self.total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM entries)').fetchone()[0]
+
+    def _object_path(self, sha):
+        return os.path.join(self.cache_dir, 'objects', sha[:2], sha)
+
+    def lookup(self, url):
+        with self.lock:
+            row = self.conn.execute('SELECT sha256, headers FROM entries WHERE url = ?', (url,)).fetchone()
+        if row is None or not os.path.exists(self._object_path(row[0])):
+            return None
+        from requests.structures import CaseInsensitiveDict
+        return {'sha256': row[0], 'headers': CaseInsensitiveDict(json.loads(row[1]))}
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def read(self, url, entry, revalidated=False):
+        with open(self._object_path(entry['sha256']), 'rb') as f:
+            body = f.read()
+        with self.lock:
+            self.conn.execute('UPDATE entries SET accessed = ? WHERE url = ?', (time.time(), url))
+            self.conn.commit()
+            if revalidated:
+                self.revalidated += 1
+            else:
+                self.hits += 1
+        METRICS.inc('http_cache_total', result='revalidated' if revalidated else 'hit')
+        return body
+
+    def store(self, url, headers, body):
+        sha = hashlib.sha256(body).hexdigest()
+        path = self._object_path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        kept = {k: headers[k] for k in self.KEPT_HEADERS if headers.get(k)}
+        now = time.time()
+        with self.lock:
+            new_object = self.conn.execute('SELECT 1 FROM entries WHERE sha256 = ? LIMIT 1', (sha,)).fetchone() is None
+            old = self.conn.execute('SELECT sha256 FROM entries WHERE url = ?', (url,)).fetchone()
+            self.conn.execute('INSERT OR REPLACE INTO entries (url, sha256, size, headers, stored, accessed) VALUES (?, ?, ?, ?, ?, ?)',
+                              (url, sha, len(body), json.dumps(kept), now, now))
+            if new_object:
+                self.total += len(body)
+            if old and old[0] != sha:
+                self._release_object(old[0])
+            self.misses += 1
+            METRICS.inc('http_cache_total', result='miss')
+            if self.total > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _release_object(self, sha):
+        # 没有其它 URL 引用同一内容时才删除正文
+        if self.conn.execute('SELECT 1 FROM entries WHERE sha256 = ? LIMIT 1', (sha,)).fetchone():
+            return
+        path = self._object_path(sha)
+        try:
+            self.total -= os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        rows = self.conn.execute('SELECT url, sha256 FROM entries ORDER BY accessed').fetchall()
+        for url, sha in rows:
+            if self.total <= self.max_bytes*0.9:
+                break
+            self.conn.execute('DELETE FROM entries WHERE url = ?', (url,))
+            self._release_object(sha)
+        logging.info('HTTP 缓存淘汰后大小: %.1f MB', self.total/1024**2)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def make_session(limiter=None, controller=None, pool_size=10, retries=True, cache=True):
+    # 依赖 requests / urllib3 的传输层放在 ybt_http.py，第一次建会话时才导入，不联网的命令不加载这些库
+    import ybt_http as http
+    # retries=False 用于由 RetryScheduler 负责重试的页面请求，失败立即返回，不在 worker 里退避；
+    # cache=False 不经过 HTTP 缓存，用于需要流式读取、提前断开的请求
+    if retries:
+        retry = http.CountingRetry(total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF, status_forcelist=RETRY_STATUSES,
+                                   allowed_methods=["HEAD","GET","OPTIONS"], metrics=METRICS)
+    else:
+        retry = 0
+    return http.make_session(USER_AGENT, retry, METRICS, HTTP_CACHE if cache else None, limiter, controller, pool_size)
+
+def sanitize_name(name):
+    return re.sub(r'[^A-Za-z0-9._-]', '_', name)
+
+def _image_ext(content_type, img_url):
+    if 'png' in content_type:
+        return '.png'
+    if 'gif' in content_type:
+        return '.gif'
+    if 'jpeg' in content_type or 'jpg' in content_type:
+        return '.jpg'
+    url_ext = os.path.splitext(urllib.parse.urlparse(img_url).path)[1]
+    return url_ext if url_ext and len(url_ext)<=6 else '.jpg'
+
+def _store_image_blob(chunks, ext, count_bytes=True):
+    # 图片正文按 sha256 内容寻址存放在 image/.objects 下，相同字节只存一份
+    obj_dir = os.path.join('image', '.objects')
+    os.makedirs(obj_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(obj_dir, f'.{threading.get_ident()}.{time.monotonic_ns()}.tmp')
+    size = 0
+    with open(tmp_path, 'wb') as f:
+        for chunk in chunks:
+            if chunk:
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    if count_bytes:
+        METRICS.inc('bytes_total', size, kind='image')
+    blob_path = os.path.join(obj_dir, digest.hexdigest() + ext)
+    if os.path.exists(blob_path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, blob_path)
+    return blob_path
+
+def _link_image(blob_path, dst):
+    # 优先硬链接，跨设备等情况退回符号链接，最后才复制；先建临时名再原子替换，不会留下半写的文件
+    tmp = f'{dst}.{threading.get_ident()}.tmp'
+    try:
+        os.link(blob_path, tmp)
+    except OSError:
+        try:
+            os.symlink(os.path.relpath(blob_path, os.path.dirname(dst)), tmp)
+        except OSError:
+            shutil.copy(blob_path, tmp)
+    os.replace(tmp, dst)
+
+def _place_image(problem_id, idx, img_url, blob_path, ext):
+    img_dir = os.path.join('image', str(problem_id))
+    os.makedirs(img_dir, exist_ok=True)
+    h = hashlib.md5(img_url.encode('utf-8')).hexdigest()[:10]
+    img_filename = sanitize_name(f"{problem_id}_{idx}_{h}{ext}")
+    img_path = os.path.join(img_dir, img_filename)
+    if os.path.exists(img_path) and os.path.samefile(img_path, blob_path):
+        return img_filename
+    _link_image(blob_path, img_path)
+    logging.info('已下载图片: %s', img_filename)
+    try:
+        primary_filename = sanitize_name(f"{problem_id}{ext}")
+        primary_path = os.path.join(img_dir, primary_filename)
+        if not os.path.lexists(primary_path):
+            _link_image(blob_path, primary_path)
+            logging.info('已创建兼容图片链接: %s', primary_filename)
+    except Exception:
+        logging.exception('创建兼容图片链接失败: %s', img_path)
+    return img_filename
+
+_PENDING_IMAGE_RE = re.compile(r'ybt-pending-image-[0-9.]+-')
+
+def _existing_image(problem_id, idx, img_url):
+    # 重新解析时不联网，按命名规则找上次已下载到本地的图片
+    h = hashlib.md5(img_url.encode('utf-8')).hexdigest()[:10]
+    prefix = sanitize_name(f"{problem_id}_{idx}_{h}")
+    img_dir = os.path.join('image', str(problem_id))
+    try:
+        names = os.listdir(img_dir)
+    except OSError:
+        names = []
+    for name in names:
+        root, ext = os.path.splitext(name)
+        if root == prefix:
+            return os.path.join(img_dir, name), ext
+    if RAW_ARCHIVE is not None:
+        data, ext = RAW_ARCHIVE.get(f'image:{img_url}')
+        if data is not None:
+            return _store_image_blob([data], ext, count_bytes=False), ext
+    logging.warning('本地没有已下载的图片: %s', img_url)
+    return None
+
+_IMAGE_MAGIC = ((b'\x89PNG\r\n\x1a\n', '.png'), (b'\xff\xd8\xff', '.jpg'), (b'GIF87a', '.gif'), (b'GIF89a', '.gif'), (b'BM', '.bmp'))
+
+def sniff_image(head):
+    # 按文件头魔数判断真实格式，不信任 Content-Type；不是图片（例如返回了错误页面）时为 None
+    for magic, ext in _IMAGE_MAGIC:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    if b'<svg' in head[:1024].lower():
+        return '.svg'
+    return None
+
+def _image_target(ext, fmt, animated):
+    # 返回的扩展名必须与 _optimize_image 实际写出的格式一致
+    if ext == '.svg' or animated:
+        return ext
+    if fmt == 'keep':
+        # 保持原格式；BMP 等只能按 PNG 重新编码的格式转成 PNG
+        return ext if ext in ('.png', '.jpg', '.gif', '.webp') else '.png'
+    if fmt == 'webp':
+        return '.webp'
+    # png：照片类的 JPEG 转 PNG 只会更大，保持原格式
+    return ext if ext == '.jpg' else '.png'
+
+def _optimize_image(blob_path, fmt, quality):
+    # 在后处理进程中执行。返回 (结果路径, 扩展名, (宽, 高), 原大小, 结果大小)，不是图片时返回 None。
+    # 结果按 原图哈希+参数 命名存入 image/.objects，已处理过的直接复用
+    from PIL import Image
+    with open(blob_path, 'rb') as f:
+        data = f.read()
+    ext = sniff_image(data[:1024])
+    if ext is None:
+        return None
+    if ext == '.svg':
+        return blob_path, ext, None, len(data), len(data)
+    try:
+        im = Image.open(io.BytesIO(data))
+        im.load()
+    except Exception:
+        return None
+    size = im.size
+    target = _image_target(ext, fmt, getattr(im, 'is_animated', False))
+    if target == ext and ext in ('.gif', '.webp', '.svg'):
+        return blob_path, ext, size, len(data), len(data)
+    obj_dir = os.path.dirname(blob_path)
+    out_path = os.path.join(obj_dir, f'{hashlib.sha256(data).hexdigest()}-{fmt}{quality}{target}')
+    if os.path.exists(out_path):
+        return out_path, target, size, len(data), os.path.getsize(out_path)
+    # 重新编码时不传 exif/icc_profile/pnginfo，元数据随之去掉
+    buf = io.BytesIO()
+    if target == '.webp':
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'A' in im.getbands() or 'transparency' in im.info else 'RGB')
+        # 题目插图多为线稿和截图，非 JPEG 来源用无损压缩
+        im.save(buf, 'WEBP', lossless=ext != '.jpg', quality=quality, method=6)
+    elif target == '.jpg':
+        im.save(buf, 'JPEG', quality='keep' if im.format == 'JPEG' else quality, optimize=True)
+    else:
+        if im.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            im = im.convert('RGBA')
+        im.save(buf, 'PNG', optimize=True)
+    out = buf.getvalue()
+    if len(out) >= len(data) and target == ext:
+        # 重新编码没有变小，保留原图
+        return blob_path, ext, size, len(data), len(data)
+    tmp_path = f'{out_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(out)
+    os.replace(tmp_path, out_path)
+    return out_path, target, size, len(data), len(out)
+
+class ImageProcessor:
+    # 图片后处理（--image-format）：在进程池中校验魔数、读取宽高、去除元数据，按需转成 WebP 或优化过的 PNG。
+    # 同一个原图只处理一次；记录每道题引用的图片宽高，提交题目时写入 images 字段
+    def __init__(self, fmt='keep', quality=85, workers=None):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise RuntimeError('--image-format 需要安装 Pillow：pip install Pillow')
+        from concurrent.futures import ProcessPoolExecutor
+        self.fmt = fmt
+        self.quality = quality
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.lock = threading.Lock()
+        self.results = {}
+        self.sizes = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def process(self, blob_path):
+        # 返回 (路径, 扩展名, 宽高)；不是有效图片时返回 None
+        with self.lock:
+            fut = self.results.get(blob_path)
+            first = fut is None
+            if first:
+                fut = self.results[blob_path] = self.executor.submit(_optimize_image, blob_path, self.fmt, self.quality)
+        with METRICS.timer('image_process'):
+            result = fut.result()
+        if result is None:
+            return None
+        path, ext, size, n_in, n_out = result
+        if first:
+            with self.lock:
+                self.bytes_in += n_in
+                self.bytes_out += n_out
+            METRICS.inc('image_bytes_total', n_in, stage='original')
+            METRICS.inc('image_bytes_total', n_out, stage='processed')
+        return path, ext, size
+
+    def record(self, problem_id, src, size):
+        with self.lock:
+            self.sizes.setdefault(str(problem_id), {})[src] = size
+
+    def pop_sizes(self, problem_id):
+        with self.lock:
+            sizes = self.sizes.pop(str(problem_id), {})
+        return [{'src': src, 'width': size[0], 'height': size[1]} for src, size in sizes.items() if size]
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.bytes_in:
+            logging.info('图片后处理：%s 张，%.1f KB -> %.1f KB（%s）', len(self.results), self.bytes_in/1024, self.bytes_out/1024, self.fmt)
+
+def _postprocess_image(found, img_url):
+    # found 为 (原图路径, 扩展名)；未启用后处理时原样返回，宽高为 None
+    if found is None:
+        return None
+    if IMAGE_PROCESSOR is None:
+        return found[0], found[1], None
+    result = IMAGE_PROCESSOR.process(found[0])
+    if result is None:
+        logging.warning('不是有效的图片，保留原链接: %s', img_url)
+    return result
+
+def _use_image(problem_id, idx, img_url, processed):
+    # 放到 image/{pid}/ 下并登记宽高，返回题面中引用的路径
+    blob_path, ext, size = processed
+    img_filename = _place_image(problem_id, idx, img_url, blob_path, ext)
+    src = f"/upload/image/{problem_id}/{img_filename}"
+    if IMAGE_PROCESSOR is not None:
+        IMAGE_PROCESSOR.record(problem_id, src, size)
+    return src
+
+# 后台图片下载的总等待时限（秒），从图片登记时开始计算
+IMAGE_DEADLINE = 120
+
+class ImagePipeline:
+    # 图片下载独立成有界线程池：页面解析时只登记图片并留下占位符，下载在后台进行，
+    # 同一 URL 只下载一次；题目提交前由 finalize 等待下载完成并替换占位符。
+    # session 为 None 时不联网，只使用本地已下载的图片
+    # 每张图片自登记起最多等待 IMAGE_DEADLINE 秒，超时的图片保留原始地址，避免慢图床拖住整个爬取
+    def __init__(self, session, max_workers=8):
+        from concurrent.futures import ThreadPoolExecutor
+        self.session = session
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image')
+        self.lock = threading.Lock()
+        self.downloads = {}
+        self.pending = {}
+        self.seq = 0
+        self.expired = False
+
+    def _download(self, img_url):
+        with METRICS.timer('image_fetch'), self.session.get(img_url, timeout=15, stream=True) as img_response:
+            if img_response.status_code != 200:
+                logging.warning('图片下载失败: %s, 状态码: %s', img_url, img_response.status_code)
+                return None
+            ext = _image_ext(img_response.headers.get('Content-Type',''), img_url)
+            blob_path = _store_image_blob(img_response.iter_content(chunk_size=8192), ext)
+            _archive_image(img_url, blob_path, ext)
+        # 后处理在本下载线程里等待进程池结果，页面 worker 不受影响
+        return _postprocess_image((blob_path, ext), img_url)
+
+    def adopt(self, problem_id, placeholder, idx, img_url, orig_src):
+        with self.lock:
+            if self.session is None:
+                fut = self.executor.submit(lambda: _postprocess_image(_existing_image(problem_id, idx, img_url), img_url))
+            else:
+                fut = self.downloads.get(img_url)
+                if fut is None:
+                    fut = self.executor.submit(self._download, img_url)
+                    self.downloads[img_url] = fut
+            deadline = time.monotonic() + IMAGE_DEADLINE
+            self.pending.setdefault(problem_id, []).append((placeholder, fut, idx, img_url, orig_src, deadline))
+
+    def defer(self, problem_id, idx, img_url, orig_src):
+        with self.lock:
+            self.seq += 1
+            placeholder = f'ybt-pending-image-{self.seq}-'
+        self.adopt(problem_id, placeholder, idx, img_url, orig_src)
+        return placeholder
+
+    def finalize(self, problem_id, problem_data):
+        with self.lock:
+            items = self.pending.pop(problem_id, [])
+        if not items or not problem_data:
+            return problem_data
+        from bs4.dammit import EntitySubstitution
+        replacements = {}
+        for placeholder, fut, idx, img_url, orig_src, deadline in items:
+            # 下载失败时恢复原始 src，与同步下载路径的行为一致
+            replacements[placeholder] = EntitySubstitution.substitute_xml(orig_src)
+            if not wait((fut,), timeout=max(0.0, deadline - time.monotonic())).done:
+                self.expired = True
+                METRICS.inc('image_timeouts_total')
+                logging.warning('图片 %s 在 %s 秒内未完成，保留原始地址', img_url, IMAGE_DEADLINE)
+                continue
+            try:
+                result = fut.result()
+                if result:
+                    replacements[placeholder] = _use_image(problem_id, idx, img_url, result)
+            except Exception:
+                logging.exception('处理图片时出错: %s', img_url)
+        for key in ('description', 'input', 'output'):
+            value = problem_data.get(key)
+            if value and 'ybt-pending-image-' in value:
+                problem_data[key] = _PENDING_IMAGE_RE.sub(lambda m: replacements.get(m.group(0), m.group(0)), value)
+        return problem_data
+
+    def close(self):
+        # 有图片超时放弃时不再等待仍在下载的线程
+        self.executor.shutdown(wait=not self.expired, cancel_futures=True)
+
+class _ImageRecorder:
+    # 解析进程中代替 ImagePipeline：只登记图片、返回占位符，下载交给主进程的 ImagePipeline
+    def __init__(self):
+        self.items = []
+
+    def defer(self, problem_id, idx, img_url, orig_src):
+        placeholder = f'ybt-pending-image-{problem_id}.{len(self.items)+1}-'
+        self.items.append((placeholder, idx, img_url, orig_src))
+        return placeholder
 
 def process_images_in_html(soup, problem_id, page_url, session):
     if SKIP_IMAGES:
@@ -68,10 +986,7 @@ def process_images_in_html(soup, problem_id, page_url, session):
         img_tags = soup.find_all('img')
         if not img_tags:
             return soup
-        img_dir = os.path.join('image', str(problem_id))
-        os.makedirs(img_dir, exist_ok=True)
-        def sanitize_name(name):
-            return re.sub(r'[^A-Za-z0-9._-]', '_', name)
+        pipeline = getattr(session, 'image_pipeline', None)
 
         for idx, img_tag in enumerate(img_tags, start=1):
             src = img_tag.get('src')
@@ -79,39 +994,23 @@ def process_images_in_html(soup, problem_id, page_url, session):
                 continue
             src = clean_html_content(src)
             img_url = src if src.startswith('http') else urljoin(page_url, src)
+            if pipeline is not None:
+                img_tag['src'] = pipeline.defer(problem_id, idx, img_url, img_tag['src'])
+                continue
             try:
-                with session.get(img_url, timeout=15, stream=True) as img_response:
+                # 异步模式的图片已在 _prefetch_image 里计时、计流量
+                prefetched = isinstance(session, _PrefetchedSession)
+                timer = nullcontext() if prefetched else METRICS.timer('image_fetch')
+                with timer, session.get(img_url, timeout=15, stream=True) as img_response:
                     if img_response.status_code != 200:
                         logging.warning('图片下载失败: %s, 状态码: %s', img_url, img_response.status_code)
                         continue
-                    content_type = img_response.headers.get('Content-Type','')
-                    if 'png' in content_type:
-                        ext = '.png'
-                    elif 'gif' in content_type:
-                        ext = '.gif'
-                    elif 'jpeg' in content_type or 'jpg' in content_type:
-                        ext = '.jpg'
-                    else:
-                        url_ext = os.path.splitext(urllib.parse.urlparse(img_url).path)[1]
-                        ext = url_ext if url_ext and len(url_ext)<=6 else '.jpg'
-                    h = hashlib.md5(img_url.encode('utf-8')).hexdigest()[:10]
-                    img_filename = sanitize_name(f"{problem_id}_{idx}_{h}{ext}")
-                    img_path = os.path.join(img_dir, img_filename)
-                    with open(img_path, 'wb') as f:
-                        for chunk in img_response.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-                    logging.info('已下载图片: %s', img_filename)
-                    try:
-                        primary_filename = sanitize_name(f"{problem_id}{ext}")
-                        primary_path = os.path.join(img_dir, primary_filename)
-                        if not os.path.exists(primary_path):
-                            shutil.copy(img_path, primary_path)
-                            logging.info('已创建兼容图片副本: %s', primary_filename)
-                    except Exception:
-                        logging.exception('创建兼容图片副本失败: %s', img_path)
-                    new_src = f"/upload/image/{problem_id}/{img_filename}"
-                    img_tag['src'] = new_src
+                    ext = _image_ext(img_response.headers.get('Content-Type',''), img_url)
+                    blob_path = _store_image_blob(img_response.iter_content(chunk_size=8192), ext, count_bytes=not prefetched)
+                    _archive_image(img_url, blob_path, ext)
+                processed = _postprocess_image((blob_path, ext), img_url)
+                if processed:
+                    img_tag['src'] = _use_image(problem_id, idx, img_url, processed)
             except Exception:
                 logging.exception('处理图片时出错: %s', img_url)
                 continue
@@ -120,42 +1019,329 @@ def process_images_in_html(soup, problem_id, page_url, session):
         logging.exception('处理HTML图片时出错')
         return soup
 
-def extract_html_from_script(script_content, problem_id, page_url, session):
+def _pshow_content(script_content):
     if not script_content:
-        return ''
+        return None
     match = re.search(r'pshow\("(.*?)"\)', script_content, re.DOTALL)
     if not match:
-        return ''
-    content = match.group(1)
-    content = clean_html_content(content).replace('\\n','\n').replace('\\t','\t')
+        return None
+    return clean_html_content(match.group(1)).replace('\\n','\n').replace('\\t','\t')
+
+def _render_fragment(content, problem_id, page_url, session):
+    # 纯文本片段经 BeautifulSoup 往返后不变，直接返回
+    if '<' not in content and '>' not in content and '&' not in content:
+        return content
+    from bs4 import BeautifulSoup
     content_soup = BeautifulSoup(content, 'html.parser')
     content_soup = process_images_in_html(content_soup, problem_id, page_url, session)
     return str(content_soup)
 
+def _fragment_text(content):
+    return re.sub(r'<[^>]+>','', content).strip()
+
+def _html_text(html_content):
+    # 由渲染后的 HTML 得到纯文本：去标签并还原 BeautifulSoup 转义的实体
+    return html.unescape(re.sub(r'<[^>]+>','', html_content)).strip() if html_content else ''
+
+_NO_TEXT_OVERRIDES = (None, None, None)
+
+class ProblemRecord:
+    # 题目记录：__slots__ 省去每条记录的 __dict__；description_text 等纯文本不单独保存，读取时由 HTML 去标签得到，
+    # 只有与原纯文本不一致时才保存原值。读写方式与原来的 dict 相同，None 表示该键不存在
+    FIELDS = ('title', 'description', 'input', 'output', 'sample_input', 'sample_output', 'time_limit', 'memory_limit')
+    TEXT_FIELDS = ('description_text', 'input_text', 'output_text')
+    OPTIONAL = ('exists', 'images')
+    KEYS = FIELDS + TEXT_FIELDS + OPTIONAL
+    __slots__ = FIELDS + OPTIONAL + ('texts',)
+
+    @classmethod
+    def from_dict(cls, data):
+        # 含未知键或键顺序不同的 dict 原样返回，保证导出的 JSON 与原来逐字节相同
+        if not isinstance(data, dict) or list(data) != [k for k in cls.KEYS if k in data]:
+            return data
+        has_texts = [k in data for k in cls.TEXT_FIELDS]
+        if any(has_texts) and not all(has_texts):
+            return data
+        rec = cls.__new__(cls)
+        for key in cls.FIELDS + cls.OPTIONAL:
+            setattr(rec, key, data.get(key))
+        if all(has_texts):
+            texts = tuple(None if data[t] == _html_text(data[h] or '') else data[t] for t, h in zip(cls.TEXT_FIELDS, cls.FIELDS[1:4]))
+            rec.texts = _NO_TEXT_OVERRIDES if texts == _NO_TEXT_OVERRIDES else texts
+        else:
+            rec.texts = None
+        return rec
+
+    def __getitem__(self, key):
+        if key in self.TEXT_FIELDS:
+            if self.texts is None:
+                raise KeyError(key)
+            i = self.TEXT_FIELDS.index(key)
+            override = self.texts[i]
+            return override if override is not None else _html_text(getattr(self, self.FIELDS[i+1]) or '')
+        if key in self.FIELDS or key in self.OPTIONAL:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.TEXT_FIELDS:
+            texts = list(self.texts or _NO_TEXT_OVERRIDES)
+            texts[self.TEXT_FIELDS.index(key)] = value
+            self.texts = tuple(texts)
+        elif key in self.FIELDS or key in self.OPTIONAL:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def keys(self):
+        return [k for k in self.KEYS if k in self]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (ProblemRecord, dict)):
+            return self.to_dict() == (other.to_dict() if isinstance(other, ProblemRecord) else other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'ProblemRecord({self.to_dict()!r})'
+
+def _problem_hook(obj):
+    # json.load 的 object_hook：题目对象直接转成 ProblemRecord，外层的 {pid: 题目} 保持 dict
+    return ProblemRecord.from_dict(obj) if 'title' in obj else obj
+
+def problem_dict(problem_data):
+    return problem_data.to_dict() if isinstance(problem_data, ProblemRecord) else problem_data
+
+def extract_html_from_script(script_content, problem_id, page_url, session):
+    content = _pshow_content(script_content)
+    if content is None:
+        return ''
+    return _render_fragment(content, problem_id, page_url, session)
+
 def extract_text_from_script(script_content):
-    if not script_content:
+    content = _pshow_content(script_content)
+    if content is None:
         return ''
-    match = re.search(r'pshow\("(.*?)"\)', script_content, re.DOTALL)
-    if match:
-        content = match.group(1)
-        content = clean_html_content(content).replace('\\n','\n').replace('\\t','\t')
-        content = re.sub(r'<[^>]+>','', content)
-        return content.strip()
-    return ''
+    return _fragment_text(content)
 
-def crawl_problem(problem_id, session):
-    url = f'http://ybt.ssoier.cn:8088/problem_show.php?pid={problem_id}'
-    try:
-        print(f'正在爬取题目 {problem_id}...')
+def fetch_problem(problem_id, session):
+    # 失败时抛出异常（非 200 状态码为 FetchError），由调用方决定是否重试
+    url = problem_url(problem_id)
+    print(f'正在爬取题目 {problem_id}...')
+    with METRICS.timer('fetch'):
         resp = session.get(url, timeout=10)
         resp.encoding = 'utf-8'
-        if resp.status_code != 200:
-            print(f'请求失败，状态码: {resp.status_code}')
-            return None
-        soup = BeautifulSoup(resp.text, 'html.parser')
+        METRICS.inc('bytes_total', len(resp.content), kind='page')
+    if resp.status_code != 200:
+        print(f'请求失败，状态码: {resp.status_code}')
+        raise FetchError(resp.status_code, _retry_after(resp.headers))
+    if RAW_ARCHIVE is not None:
+        save_raw_page(problem_id, resp.text)
+    data = parse_problem_page(resp.text, problem_id, url, session)
+    if data is None:
+        raise ParseError()
+    return data
+
+def crawl_problem(problem_id, session):
+    try:
+        return fetch_problem(problem_id, session)
+    except Exception:
+        logging.exception('爬取题目 %s 时出错', problem_id)
+        return None
+
+# 以下几个扫描器从整页中一次性取出解析需要的全部原始字段：
+# 所有 <h3> 的文本（strip 后拼接）、页面正文文本、含 pshow 的脚本、前两个 <pre> 的文本。
+# 文本的取法与 BeautifulSoup 的 get_text 一致（不含 script/style/template 和注释）
+_NO_TEXT_TAGS = frozenset(('script', 'style', 'template'))
+_VOID_TAGS = frozenset(('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem',
+                        'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame',
+                        'image', 'isindex', 'nextid', 'spacer'))
+
+class _PageScanner(HTMLParser):
+    # 标准库流式扫描，不建树；开闭标签的配对方式与 BeautifulSoup 的 html.parser 构建器相同
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.no_text = 0
+        self.in_script = False
+        self.open_h3 = []
+        self.open_pre = []
+        self.pre_flags = []
+        self.h3 = []
+        self.pres = []
+        self.text = []
+        self.scripts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _VOID_TAGS:
+            return
+        self.stack.append(tag)
+        if tag in _NO_TEXT_TAGS:
+            self.no_text += 1
+        if tag == 'script':
+            self.in_script = True
+            self.scripts.append([])
+        elif tag == 'h3':
+            self.h3.append([])
+            self.open_h3.append(self.h3[-1])
+        elif tag == 'pre':
+            # 只记录前两个 <pre>
+            self.pre_flags.append(len(self.pres) < 2)
+            if self.pre_flags[-1]:
+                self.pres.append([])
+                self.open_pre.append(self.pres[-1])
+
+    def handle_startendtag(self, tag, attrs):
+        pass
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack:
+            return
+        while self.stack:
+            name = self.stack.pop()
+            if name in _NO_TEXT_TAGS:
+                self.no_text -= 1
+            if name == 'script':
+                self.in_script = False
+            elif name == 'h3':
+                self.open_h3.pop()
+            elif name == 'pre' and self.pre_flags.pop():
+                self.open_pre.pop()
+            if name == tag:
+                break
+
+    def handle_data(self, data):
+        if self.in_script:
+            self.scripts[-1].append(data)
+        if self.no_text:
+            return
+        self.text.append(data)
+        for buf in self.open_h3:
+            buf.append(data)
+        for buf in self.open_pre:
+            buf.append(data)
+
+def _scan_stdlib(page_text):
+    scanner = _PageScanner()
+    scanner.feed(page_text)
+    scanner.close()
+    return {
+        'h3': [''.join(p.strip() for p in parts) for parts in scanner.h3],
+        'text': ''.join(scanner.text),
+        'scripts': [''.join(parts) for parts in scanner.scripts],
+        'pres': [''.join(parts) for parts in scanner.pres],
+    }
+
+# <h3> 里出现块级标签时，lxml 按 HTML 规则提前关闭 <h3>，与 bs4 / stdlib 的树不同
+_BLOCK_IN_H3_RE = re.compile(r'<h3[^>]*>(?:(?!</h3>).)*?<(?:p|div|table|ul|ol|pre|h[1-6])\b', re.S | re.I)
+
+def _scan_lxml(page_text):
+    from lxml import etree, html as lxml_html
+    if not page_text.strip():
+        return {'h3': [], 'text': '', 'scripts': [], 'pres': []}
+    if _BLOCK_IN_H3_RE.search(page_text):
+        return _scan_stdlib(page_text)
+    # 传入 bytes 并指定编码：带 <?xml ... encoding=...?> 声明的页面不接受 str 输入
+    root = lxml_html.document_fromstring(page_text.encode('utf-8'), parser=lxml_html.HTMLParser(encoding='utf-8'))
+    h3, pres, text, scripts = [], [], [], []
+    open_h3, open_pre, pre_flags = [], [], []
+    no_text = 0
+    # iterwalk 的 start/end 事件按文档顺序给出 text 与 tail，一次遍历即可还原全部文本；
+    # 注释和处理指令没有 start/end 事件，只取它们的 tail
+    for event, el in etree.iterwalk(root, events=('start', 'end', 'comment', 'pi')):
+        tag = el.tag if isinstance(el.tag, str) else None
+        if event in ('comment', 'pi'):
+            data = el.tail
+        elif event == 'start':
+            if tag in _NO_TEXT_TAGS:
+                no_text += 1
+                if tag == 'script':
+                    scripts.append(el.text or '')
+            elif tag == 'h3':
+                h3.append([])
+                open_h3.append(h3[-1])
+            elif tag == 'pre':
+                pre_flags.append(len(pres) < 2)
+                if pre_flags[-1]:
+                    pres.append([])
+                    open_pre.append(pres[-1])
+            data = el.text if tag is not None else None
+        else:
+            if tag in _NO_TEXT_TAGS:
+                no_text -= 1
+            elif tag == 'h3':
+                open_h3.pop()
+            elif tag == 'pre' and pre_flags.pop():
+                open_pre.pop()
+            data = el.tail
+        if data and not no_text:
+            text.append(data)
+            for buf in open_h3:
+                buf.append(data)
+            for buf in open_pre:
+                buf.append(data)
+    return {
+        'h3': [''.join(p.strip() for p in parts) for parts in h3],
+        'text': ''.join(text),
+        'scripts': scripts,
+        'pres': [''.join(parts) for parts in pres],
+    }
+
+def _scan_bs4(page_text):
+    # 旧的多遍 BeautifulSoup 解析，保留作为对照
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(page_text, 'html.parser')
+    return {
+        'h3': [h3.get_text(strip=True) for h3 in soup.find_all('h3')],
+        'text': soup.get_text(),
+        'scripts': [script.get_text() for script in soup.find_all('script')],
+        'pres': [pre.get_text(strip=False) for pre in soup.find_all('pre', limit=2)],
+    }
+
+PAGE_SCANNERS = {'lxml': _scan_lxml, 'stdlib': _scan_stdlib, 'bs4': _scan_bs4}
+
+def resolve_parser_backend(name=None):
+    name = name or PARSER_BACKEND
+    if name != 'auto':
+        return name
+    try:
+        import lxml.html  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'stdlib'
+
+def scan_problem_page(page_text, backend=None):
+    return PAGE_SCANNERS[resolve_parser_backend(backend)](page_text)
+
+def parse_problem_page(page_text, problem_id, url, session, backend=None):
+    with METRICS.timer('parse'):
+        return _parse_problem_page(page_text, problem_id, url, session, backend)
+
+def _parse_problem_page(page_text, problem_id, url, session, backend):
+    try:
+        fields = scan_problem_page(page_text, backend)
         title = ''
-        for h3 in soup.find_all('h3'):
-            h3_text = h3.get_text(strip=True)
+        for h3_text in fields['h3']:
             if str(problem_id) in h3_text:
                 title = h3_text
                 break
@@ -165,7 +1351,7 @@ def crawl_problem(problem_id, session):
             problem_exists = False
         time_limit = '1000'
         memory_limit = '32768'
-        all_text = soup.get_text()
+        all_text = fields['text']
         tm = re.search(r'时间限制\s*[:：]\s*(\d+)\s*ms', all_text)
         if tm:
             time_limit = tm.group(1)
@@ -174,13 +1360,16 @@ def crawl_problem(problem_id, session):
             memory_limit = mm.group(1)
         found_html = []
         found_text = []
-        for script in soup.find_all('script'):
-            s = script.get_text() if script else ''
+        for s in fields['scripts']:
             if s and 'pshow' in s:
-                htmlc = extract_html_from_script(s, problem_id, url, session)
+                # pshow 正则和反转义每个脚本只做一次，HTML 与纯文本共用
+                content = _pshow_content(s)
+                if content is None:
+                    continue
+                htmlc = _render_fragment(content, problem_id, url, session)
                 if htmlc:
                     found_html.append(htmlc)
-                tc = extract_text_from_script(s)
+                tc = _fragment_text(content)
                 if tc:
                     found_text.append(tc)
         problem_description_html = found_html[0] if len(found_html)>=1 else ''
@@ -191,13 +1380,13 @@ def crawl_problem(problem_id, session):
         output_description_text = found_text[2] if len(found_text)>=3 else ''
         input_sample = ''
         output_sample = ''
-        pre_tags = soup.find_all('pre')
-        if len(pre_tags) >=2:
-            input_sample = pre_tags[0].get_text(strip=False).strip()
-            output_sample = pre_tags[1].get_text(strip=False).strip()
-        elif len(pre_tags) ==1:
-            output_sample = pre_tags[0].get_text(strip=False).strip()
-        pdata = {
+        pre_texts = fields['pres']
+        if len(pre_texts) >=2:
+            input_sample = pre_texts[0].strip()
+            output_sample = pre_texts[1].strip()
+        elif len(pre_texts) ==1:
+            output_sample = pre_texts[0].strip()
+        pdata = ProblemRecord.from_dict({
             'title': title,
             'description': problem_description_html,
             'input': input_description_html,
@@ -210,13 +1399,17 @@ def crawl_problem(problem_id, session):
             'input_text': input_description_text,
             'output_text': output_description_text,
             'exists': problem_exists
-        }
+        })
         return pdata
     except Exception:
-        logging.exception('爬取题目 %s 时出错', problem_id)
+        logging.exception('解析题目 %s 时出错', problem_id)
         return None
 
 def save_sample_files(problem_data, problem_id):
+    with METRICS.timer('sample_write'):
+        return _save_sample_files(problem_data, problem_id)
+
+def _save_sample_files(problem_data, problem_id):
     if not problem_data:
         return False
     if not problem_data.get('exists', True):
@@ -237,7 +1430,36 @@ def save_sample_files(problem_data, problem_id):
         logging.exception('保存样例文件失败: %s', problem_id)
         return False
 
+SQL_HEADER = """-- 设置字符集
+SET NAMES utf8mb4;
+
+-- 使用数据库
+USE jol;
+
+-- 插入题目数据
+"""
+
+SQL_INSERT_COLUMNS = """INSERT INTO `problem` (
+    `title`, `description`, `input`, `output`, `sample_input`, `sample_output`,
+    `spj`, `hint`, `source`, `in_date`, `time_limit`, `memory_limit`,
+    `defunct`, `accepted`, `submit`, `solved`, `remote_oj`, `remote_id`
+)"""
+
+SQL_INSERT_PREFIX = SQL_INSERT_COLUMNS + " VALUES "
+
 def generate_sql_insert(problem_data, problem_id):
+    values = problem_sql_values(problem_data, problem_id)
+    if values is None:
+        return None
+    return f"{SQL_INSERT_PREFIX}{values};"
+
+# 增量同步时写入 remote_oj/remote_id，作为题目在 problem 表中的稳定来源标识
+REMOTE_OJ = 'ybt'
+
+PROBLEM_SOURCE = '信息学奥赛一本通（C++版）在线评测系统'
+
+def problem_sql_fields(problem_data, problem_id, escape=True):
+    # escape=False 时返回未转义的原值，供参数化写库使用
     if not problem_data:
         return None
     if not problem_data.get('exists', True):
@@ -253,6 +1475,8 @@ def generate_sql_insert(problem_data, problem_id):
             if not text:
                 return ''
             text = clean_html_content(text)
+            if not escape:
+                return text
             text = text.replace('\\','\\\\')
             text = text.replace("'","''")
             return text
@@ -293,105 +1517,1932 @@ def generate_sql_insert(problem_data, problem_id):
 
         time_limit = float(problem_data.get('time_limit', '1000'))/1000
         memory_limit = int(problem_data.get('memory_limit', '32768'))//1024
-        current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return {
+            'title': title,
+            'description': description,
+            'input': input_desc,
+            'output': output_desc,
+            'sample_input': sample_input,
+            'sample_output': sample_output,
+            'time_limit': time_limit,
+            'memory_limit': memory_limit,
+        }
+    except Exception:
+        logging.exception('生成SQL时出错: %s', problem_id)
+        return None
 
-        sql = f"""INSERT INTO `problem` (
-    `title`, `description`, `input`, `output`, `sample_input`, `sample_output`,
-    `spj`, `hint`, `source`, `in_date`, `time_limit`, `memory_limit`,
-    `defunct`, `accepted`, `submit`, `solved`, `remote_oj`, `remote_id`
-) VALUES (
-    '{title}',
-    '{description}',
-    '{input_desc}',
-    '{output_desc}',
-    '{sample_input}',
-    '{sample_output}',
+def problem_sql_values(problem_data, problem_id, remote=False):
+    f = problem_sql_fields(problem_data, problem_id)
+    if f is None:
+        return None
+    current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    remote_oj = f"'{REMOTE_OJ}'" if remote else 'NULL'
+    remote_id = f"'{problem_id}'" if remote else 'NULL'
+    values = f"""(
+    '{f['title']}',
+    '{f['description']}',
+    '{f['input']}',
+    '{f['output']}',
+    '{f['sample_input']}',
+    '{f['sample_output']}',
     '0',
     NULL,
-    '信息学奥赛一本通（C++版）在线评测系统',
+    '{PROBLEM_SOURCE}',
     '{current_time}',
-    {time_limit:.3f},
-    {memory_limit},
+    {f['time_limit']:.3f},
+    {f['memory_limit']},
     'N',
     0,
     0,
     0,
-    NULL,
-    NULL
-);"""
-        return sql
-    except Exception:
-        logging.exception('生成SQL时出错: %s', problem_id)
+    {remote_oj},
+    {remote_id}
+)"""
+    return values
+
+def problem_sql_update(problem_data, problem_id):
+    # 只更新题面相关字段，保留 in_date 和提交统计
+    f = problem_sql_fields(problem_data, problem_id)
+    if f is None:
         return None
+    return f"""UPDATE `problem` SET
+    `title` = '{f['title']}',
+    `description` = '{f['description']}',
+    `input` = '{f['input']}',
+    `output` = '{f['output']}',
+    `sample_input` = '{f['sample_input']}',
+    `sample_output` = '{f['sample_output']}',
+    `time_limit` = {f['time_limit']:.3f},
+    `memory_limit` = {f['memory_limit']}
+WHERE `remote_oj` = '{REMOTE_OJ}' AND `remote_id` = '{problem_id}';"""
 
-def create_sql_file(problems, start_id, end_id):
-    sql_file = f"problems_{start_id}_{end_id}.sql"
-    sql_content = """-- 设置字符集
-SET NAMES utf8mb4;
+def problem_sql_insert_missing(problem_data, problem_id):
+    # 只在 problem 表中还没有该 remote_id 时插入，同一份 SQL 重复导入不会产生重复行
+    values = problem_sql_values(problem_data, problem_id, remote=True)
+    if values is None:
+        return None
+    return f"""{SQL_INSERT_COLUMNS}
+SELECT {values[1:-1].strip()}
+FROM DUAL WHERE NOT EXISTS (SELECT 1 FROM `problem` WHERE `remote_oj` = '{REMOTE_OJ}' AND `remote_id` = '{problem_id}');"""
 
--- 使用数据库
-USE jol;
+FINGERPRINT_FIELDS = ('title', 'description', 'input', 'output', 'sample_input', 'sample_output', 'time_limit', 'memory_limit')
 
--- 插入题目数据
-"""
-    for pid_str, pdata in problems.items():
-        try:
-            pid = int(pid_str)
-        except Exception:
+def problem_fingerprint(problem_data):
+    payload = json.dumps([str(problem_data.get(k, '')) for k in FINGERPRINT_FIELDS], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class SyncState:
+    # 增量同步状态：记录每道题上次写入 SQL 时的内容指纹，跨范围、跨运行共用
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS fingerprints (pid INTEGER PRIMARY KEY, fingerprint TEXT NOT NULL, synced TEXT NOT NULL)')
+        self.conn.commit()
+
+    def get(self, problem_id):
+        row = self.conn.execute('SELECT fingerprint FROM fingerprints WHERE pid = ?', (int(problem_id),)).fetchone()
+        return row[0] if row else None
+
+    def update(self, fingerprints):
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.conn.executemany('INSERT OR REPLACE INTO fingerprints (pid, fingerprint, synced) VALUES (?, ?, ?)',
+                              [(int(pid), fp, now) for pid, fp in fingerprints])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+# 中文按单字和相邻两字（bigram）切分，字母数字按整词切分
+_TOKEN_RE = re.compile(r'[0-9a-z_]+|[\u3400-\u9fff\uf900-\ufaff]+')
+
+def tokenize(text, unigrams=True):
+    terms = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if run[0] < '\u3400':
+            terms.append(run)
             continue
-        if pdata:
-            sql = generate_sql_insert(pdata, pid)
-            if sql:
-                sql_content += sql + "\n\n"
-    with open(sql_file, 'w', encoding='utf-8') as f:
-        f.write(sql_content)
-    print(f"SQL文件已保存到: {sql_file}")
-    return sql_file
+        if unigrams or len(run) == 1:
+            terms.extend(run)
+        terms.extend(run[i:i+2] for i in range(len(run)-1))
+    return terms
 
-def crawl_ids_concurrent(id_list, max_workers=3, rate_delay=0.5):
-    results = {}
-    failed = []
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        futures = {ex.submit(crawl_problem, pid, make_session()): pid for pid in id_list}
-        for fut in as_completed(futures):
-            pid = futures[fut]
-            try:
-                data = fut.result()
-                if data and data.get('exists', True):
-                    results[pid] = data
-                    try:
-                        save_sample_files(data, pid)
-                    except Exception:
-                        logging.exception('保存样例失败: %s', pid)
-                elif data:
-                    results[pid] = data
+def search_text(problem_data):
+    # 检索用的文本：标题 + 解析时由 extract_text_from_script 得到的纯文本
+    parts = [problem_data.get('title') or '']
+    for text_key, html_key in (('description_text', 'description'), ('input_text', 'input'), ('output_text', 'output')):
+        text = problem_data.get(text_key)
+        parts.append(text if text is not None else _html_text(problem_data.get(html_key) or ''))
+    return '\n'.join(parts)
+
+class SearchIndex:
+    # 全文检索倒排索引：postings 以 (词项, 题号) 为主键，查询时按词项范围扫描；按 BM25 排序，标题中的词项权重更高。
+    # docs 记录每道题的文本和指纹，指纹不变的题目不重复索引
+    TITLE_WEIGHT = 3
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        # 文本单独成表，打分时只读很小的 docs 表
+        self.conn.execute('CREATE TABLE IF NOT EXISTS docs (pid INTEGER PRIMARY KEY, length INTEGER NOT NULL, fingerprint TEXT NOT NULL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS texts (pid INTEGER PRIMARY KEY, title TEXT NOT NULL, text TEXT NOT NULL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, pid INTEGER NOT NULL, tf INTEGER NOT NULL, '
+                          'PRIMARY KEY (term, pid)) WITHOUT ROWID')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS postings_pid ON postings (pid)')
+        self.conn.commit()
+
+    def _remove(self, pid):
+        self.conn.execute('DELETE FROM postings WHERE pid = ?', (pid,))
+        self.conn.execute('DELETE FROM docs WHERE pid = ?', (pid,))
+        self.conn.execute('DELETE FROM texts WHERE pid = ?', (pid,))
+
+    def update(self, problem_id, problem_data, commit=True):
+        # 返回是否有变化；不存在的题目从索引中删除
+        pid = int(problem_id)
+        with self.lock:
+            if not problem_data or not problem_data.get('exists', True):
+                changed = self.conn.execute('SELECT 1 FROM docs WHERE pid = ?', (pid,)).fetchone() is not None
+                self._remove(pid)
+            else:
+                title = problem_data.get('title') or ''
+                text = search_text(problem_data)
+                fingerprint = hashlib.sha1(text.encode('utf-8')).hexdigest()
+                row = self.conn.execute('SELECT fingerprint FROM docs WHERE pid = ?', (pid,)).fetchone()
+                changed = row is None or row[0] != fingerprint
+                if changed:
+                    tf = {}
+                    for term in tokenize(text):
+                        tf[term] = tf.get(term, 0) + 1
+                    for term in tokenize(title):
+                        tf[term] += self.TITLE_WEIGHT - 1
+                    self._remove(pid)
+                    self.conn.executemany('INSERT INTO postings (term, pid, tf) VALUES (?, ?, ?)', ((t, pid, n) for t, n in tf.items()))
+                    self.conn.execute('INSERT INTO docs (pid, length, fingerprint) VALUES (?, ?, ?)', (pid, sum(tf.values()), fingerprint))
+                    self.conn.execute('INSERT INTO texts (pid, title, text) VALUES (?, ?, ?)', (pid, title, text))
+            if commit:
+                self.conn.commit()
+        return changed
+
+    def update_many(self, items):
+        changed = 0
+        for pid, pdata in items:
+            changed += self.update(pid, pdata, commit=False)
+        with self.lock:
+            self.conn.commit()
+        return changed
+
+    def search(self, query, limit=20):
+        # 多个关键词都必须出现；返回 [(pid, 标题, 得分, 摘要)]
+        # 关键词中的标点忽略，各段字母数字或中文分别匹配
+        keywords = _TOKEN_RE.findall(query.lower())
+        if not keywords:
+            return []
+        terms = []
+        for keyword in keywords:
+            for term in tokenize(keyword, unigrams=len(keyword) == 1):
+                if term not in terms:
+                    terms.append(term)
+        with self.lock:
+            n_docs, avg_len = self.conn.execute('SELECT COUNT(*), AVG(length) FROM docs').fetchone()
+            # 从最少见的词项开始求交集；候选不多时其余词项只按候选题号查
+            dfs = {t: self.conn.execute('SELECT COUNT(*) FROM postings WHERE term = ?', (t,)).fetchone()[0] for t in terms}
+            postings = []
+            candidates = None
+            for term in sorted(terms, key=dfs.get):
+                if candidates is None or len(candidates) > 1000:
+                    p = dict(self.conn.execute('SELECT pid, tf FROM postings WHERE term = ?', (term,)).fetchall())
                 else:
+                    p = dict(self._rows('SELECT pid, tf FROM postings WHERE term = ? AND pid IN ({})', sorted(candidates), term))
+                candidates = p.keys() & candidates if candidates is not None else set(p)
+                postings.append((dfs[term], p))
+                if not candidates:
+                    return []
+            lengths = dict(self._rows('SELECT pid, length FROM docs WHERE pid IN ({})', sorted(candidates)))
+        # 先只用倒排表打分排序，再按名次取原文确认和截取摘要，不必读出所有候选的原文
+        weighted = [(math.log(1 + (n_docs - df + 0.5) / (df + 0.5)) * (self.K1 + 1), p) for df, p in postings]
+        scores = {}
+        for pid, length in lengths.items():
+            norm = self.K1 * (1 - self.B + self.B * length / avg_len)
+            score = 0.0
+            for w, p in weighted:
+                tf = p[pid]
+                score += w * tf / (tf + norm)
+            scores[pid] = score
+        ranked = sorted(scores, key=lambda pid: (-scores[pid], pid))
+        results = []
+        for i in range(0, len(ranked), limit):
+            with self.lock:
+                docs = dict((r[0], r[1:]) for r in self._rows('SELECT pid, title, text FROM texts WHERE pid IN ({})', ranked[i:i+limit]))
+            for pid in ranked[i:i+limit]:
+                title, text = docs[pid]
+                lowered = text.lower()
+                # bigram 全部命中不代表关键词连续出现，用原文再确认一次
+                if not all(k in lowered for k in keywords):
+                    continue
+                at = lowered.find(keywords[0])
+                snippet = text[max(0, at-20):at+len(keywords[0])+30].replace('\n', ' ')
+                results.append((pid, title, scores[pid], snippet))
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def _rows(self, sql, ids, *params):
+        # IN 列表分块查询，params 放在题号之前
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i+500]
+            yield from self.conn.execute(sql.format(','.join('?'*len(chunk))), (*params, *chunk))
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# 近似重复检测：MinHash 签名 + LSH 分段。签名用单次哈希的 one-permutation hashing（每个 shingle 只算一次 crc32，
+# 按高位分桶取最小值，空桶从右侧最近的非空桶借值），纯 Python 下 1 万道题也只需数秒
+MINHASH_SIZE = 128
+LSH_BANDS = 16
+DEDUP_SHINGLE = 5
+_DEDUP_STRIP_RE = re.compile(r'[\W_]+')
+_TITLE_PID_RE = re.compile(r'^\s*\d+\s*[：:]')
+
+def dedup_text(problem_data):
+    # 标题去掉题号前缀，连同题面、输入输出说明和样例一起去掉空白和标点，排版不同的同一题得到相同文本
+    parts = [_TITLE_PID_RE.sub('', search_text(problem_data), count=1),
+             problem_data.get('sample_input') or '', problem_data.get('sample_output') or '']
+    return _DEDUP_STRIP_RE.sub('', ''.join(parts).lower())
+
+def minhash_signature(text, k=DEDUP_SHINGLE):
+    shift = 32 - (MINHASH_SIZE.bit_length() - 1)
+    mask = (1 << shift) - 1
+    empty = mask + 1
+    sig = [empty] * MINHASH_SIZE
+    data = text.encode('utf-32-le')
+    width = 4 * k
+    for i in range(0, max(len(data) - width, 0) + 4, 4):
+        # crc32 的低位与输入线性相关，乘一个奇数常数打散后取高位作桶号
+        h = (zlib.crc32(data[i:i+width]) * 0x9E3779B1) & 0xFFFFFFFF
+        b = h >> shift
+        v = h & mask
+        if v < sig[b]:
+            sig[b] = v
+    if empty in sig:
+        if all(v == empty for v in sig):
+            return array.array('I', sig)
+        # 空桶按固定规则从右侧借值并加上距离偏移，两篇文本的借值方式一致，仍可按桶比较
+        filled = list(sig)
+        for b in range(MINHASH_SIZE):
+            if sig[b] == empty:
+                d = 1
+                while sig[(b + d) % MINHASH_SIZE] == empty:
+                    d += 1
+                filled[b] = (sig[(b + d) % MINHASH_SIZE] + d * 0x61C88647) & 0xFFFFFFFF
+        sig = filled
+    return array.array('I', sig)
+
+def minhash_similarity(a, b):
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+def find_duplicates(problems, threshold=0.8, max_bucket=64):
+    # 返回 (簇列表, 题目数)；每个簇为 (保留的题号, [(重复题号, 估计相似度), ...])，保留题号最小的一道。
+    # 同一段签名相同的题目为候选对，只有估计的 Jaccard 相似度达到 threshold 才算重复
+    rows = MINHASH_SIZE // LSH_BANDS
+    signatures = {}
+    buckets = {}
+    for pid_str, pdata in problems.items():
+        try:
+            pid = int(pid_str)
+        except Exception:
+            continue
+        if not pdata or not pdata.get('exists', True):
+            continue
+        text = dedup_text(pdata)
+        if not text:
+            continue
+        sig = minhash_signature(text)
+        signatures[pid] = sig
+        raw = sig.tobytes()
+        for band in range(LSH_BANDS):
+            buckets.setdefault((band, raw[band*rows*4:(band+1)*rows*4]), []).append(pid)
+    pairs = set()
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        if len(members) > max_bucket:
+            # 超大的桶只与桶内第一道题比较，避免平方级的比较次数
+            pairs.update((members[0], m) for m in members[1:])
+        else:
+            pairs.update((a, b) for i, a in enumerate(members) for b in members[i+1:])
+    parent = {}
+
+    def root(x):
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+    for a, b in pairs:
+        if minhash_similarity(signatures[a], signatures[b]) >= threshold:
+            ra, rb = root(a), root(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+    groups = {}
+    for pid in parent:
+        groups.setdefault(root(pid), []).append(pid)
+    clusters = []
+    for keep in sorted(groups):
+        dups = sorted(p for p in groups[keep] if p != keep)
+        clusters.append((keep, [(p, round(minhash_similarity(signatures[keep], signatures[p]), 3)) for p in dups]))
+    return clusters, len(signatures)
+
+def write_dedup_report(path, problems, clusters, total, threshold):
+    titles = {}
+    wanted = {pid for keep, dups in clusters for pid in [keep] + [p for p, _ in dups]}
+    for pid_str, pdata in problems.items():
+        if str(pid_str).isdigit() and int(pid_str) in wanted:
+            titles[int(pid_str)] = pdata.get('title') or ''
+    report = {
+        'threshold': threshold,
+        'problems': total,
+        'clusters': [{'keep': keep, 'title': titles.get(keep, ''),
+                      'duplicates': [{'pid': p, 'title': titles.get(p, ''), 'similarity': sim} for p, sim in dups]}
+                     for keep, dups in clusters],
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+class SkipProblems:
+    # problems 的过滤视图：生成 SQL / 写库时跳过 skip 中的题号
+    def __init__(self, problems, skip):
+        self.problems = problems
+        self.skip = skip
+
+    def items(self):
+        for pid_str, pdata in self.problems.items():
+            if str(pid_str).isdigit() and int(pid_str) in self.skip:
+                continue
+            yield pid_str, pdata
+
+class SqlWriter:
+    # 流式写 SQL 文件：边生成边落盘，每条 INSERT 最多合并 batch_size 行，
+    # txn_size>0 时每 txn_size 条 INSERT 包在一个事务中
+    def __init__(self, path, batch_size=1, txn_size=0):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.txn_size = max(0, txn_size)
+        self.pending = []
+        self.statements_in_txn = 0
+        self.rows = 0
+        self.tmp_path = path + '.tmp'
+        self.f = open(self.tmp_path, 'w', encoding='utf-8')
+        self.f.write(SQL_HEADER)
+
+    def add(self, problem_data, problem_id):
+        return self.add_values(problem_sql_values(problem_data, problem_id))
+
+    def add_values(self, values):
+        if values is None:
+            return False
+        self.pending.append(values)
+        self.rows += 1
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+        return True
+
+    def add_statement(self, sql):
+        if sql is None:
+            return False
+        self._write_statement(sql)
+        self.rows += 1
+        return True
+
+    def _write_statement(self, sql):
+        if self.txn_size and self.statements_in_txn == 0:
+            self.f.write("START TRANSACTION;\n\n")
+        self.f.write(sql + "\n\n")
+        if self.txn_size:
+            self.statements_in_txn += 1
+            if self.statements_in_txn >= self.txn_size:
+                self._commit()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        sql = SQL_INSERT_PREFIX + ",\n".join(self.pending) + ";"
+        self.pending = []
+        self._write_statement(sql)
+
+    def _commit(self):
+        if self.statements_in_txn:
+            self.f.write("COMMIT;\n\n")
+            self.statements_in_txn = 0
+
+    def close(self):
+        self._flush()
+        self._commit()
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.f.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+def _sql_values_chunk(chunk):
+    return [problem_sql_values(pdata, pid) for pid, pdata in chunk]
+
+def _iter_sql_values(problems, chunk_size=64):
+    items = []
+    for pid_str, pdata in problems.items():
+        try:
+            pid = int(pid_str)
+        except Exception:
+            continue
+        if pdata:
+            items.append((pid, pdata))
+        if len(items) >= chunk_size:
+            yield items
+            items = []
+    if items:
+        yield items
+
+def create_sql_file(problems, start_id, end_id, batch_size=1, txn_size=0, workers=0):
+    sql_file = f"problems_{start_id}_{end_id}.sql"
+    with METRICS.timer('sql'), SqlWriter(sql_file, batch_size, txn_size) as writer:
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            # 多进程生成 VALUES，按原顺序写出；同时在途的分块数有上限，不会把全部题目读进内存
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                inflight = deque()
+                for chunk in _iter_sql_values(problems):
+                    inflight.append(ex.submit(_sql_values_chunk, chunk))
+                    if len(inflight) >= workers*2:
+                        for values in inflight.popleft().result():
+                            writer.add_values(values)
+                while inflight:
+                    for values in inflight.popleft().result():
+                        writer.add_values(values)
+        else:
+            for chunk in _iter_sql_values(problems):
+                for values in _sql_values_chunk(chunk):
+                    writer.add_values(values)
+    print(f"SQL文件已保存到: {sql_file}")
+    return sql_file
+
+def _delta_sql_path(start_id, end_id):
+    # 每次运行写一个新文件，导入前再次运行不会覆盖尚未导入的增量
+    stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    path = f"problems_{start_id}_{end_id}_delta_{stamp}.sql"
+    seq = 1
+    while os.path.exists(path):
+        seq += 1
+        path = f"problems_{start_id}_{end_id}_delta_{stamp}_{seq}.sql"
+    return path
+
+def create_incremental_sql_file(problems, start_id, end_id, state, batch_size=1, txn_size=0):
+    # 只为新增或内容变化的题目生成 SQL。每道题先按 remote_id UPDATE，再在不存在时 INSERT，
+    # 不论目标库里有没有这道题结果都正确：增量文件可以重复导入，状态文件丢失后重跑也不会重复插入。
+    # SQL 文件写完后才更新指纹
+    sql_file = _delta_sql_path(start_id, end_id)
+    fingerprints = []
+    inserted = updated = unchanged = 0
+    writer = SqlWriter(sql_file, batch_size, txn_size)
+    try:
+        with METRICS.timer('sql'):
+            for pid_str, pdata in problems.items():
+                try:
+                    pid = int(pid_str)
+                except Exception:
+                    continue
+                if not pdata or not pdata.get('exists', True):
+                    continue
+                fp = problem_fingerprint(pdata)
+                old = state.get(pid)
+                if old == fp:
+                    unchanged += 1
+                    continue
+                insert = problem_sql_insert_missing(pdata, pid)
+                if insert is None:
+                    continue
+                writer.add_statement(problem_sql_update(pdata, pid))
+                writer.add_statement(insert)
+                if old is None:
+                    inserted += 1
+                else:
+                    updated += 1
+                fingerprints.append((pid, fp))
+    except BaseException:
+        writer.abort()
+        raise
+    if not fingerprints:
+        writer.abort()
+        print(f"没有新增或变化的题目，未生成增量SQL文件（未变化 {unchanged}）")
+        return None
+    writer.close()
+    state.update(fingerprints)
+    print(f"增量SQL文件已保存到: {sql_file}（新增 {inserted}，更新 {updated}，未变化 {unchanged}）")
+    return sql_file
+
+PROBLEM_COLUMNS = ('title', 'description', 'input', 'output', 'sample_input', 'sample_output',
+                   'spj', 'hint', 'source', 'in_date', 'time_limit', 'memory_limit',
+                   'defunct', 'accepted', 'submit', 'solved', 'remote_oj', 'remote_id')
+
+# SQLite 替身库的表结构，只包含导入用到的列；MySQL 目标库使用已有的 jol.problem 表
+SQLITE_PROBLEM_SCHEMA = """CREATE TABLE IF NOT EXISTS `problem` (
+    `problem_id` INTEGER PRIMARY KEY AUTOINCREMENT,
+    `title` TEXT NOT NULL DEFAULT '', `description` TEXT, `input` TEXT, `output` TEXT,
+    `sample_input` TEXT, `sample_output` TEXT, `spj` CHAR(1) NOT NULL DEFAULT '0', `hint` TEXT, `source` TEXT,
+    `in_date` DATETIME, `time_limit` DECIMAL(10,3) NOT NULL DEFAULT 0, `memory_limit` INTEGER NOT NULL DEFAULT 0,
+    `defunct` CHAR(1) NOT NULL DEFAULT 'N', `accepted` INTEGER DEFAULT 0, `submit` INTEGER DEFAULT 0, `solved` INTEGER DEFAULT 0,
+    `remote_oj` VARCHAR(16), `remote_id` VARCHAR(32)
+)"""
+
+def problem_row(problem_data, problem_id, in_date):
+    # 与 problem_sql_values 相同的列值，写入 remote_oj/remote_id 以便续导时识别已导入的题目
+    f = problem_sql_fields(problem_data, problem_id, escape=False)
+    if f is None:
+        return None
+    return (f['title'], f['description'], f['input'], f['output'], f['sample_input'], f['sample_output'],
+            '0', None, PROBLEM_SOURCE, in_date, round(f['time_limit'], 3), f['memory_limit'],
+            'N', 0, 0, 0, REMOTE_OJ, str(problem_id))
+
+class ConnectionPool:
+    # 固定大小的连接池：按需建立连接，用完放回，最多 size 个
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.size = max(1, size)
+        self.idle = queue.Queue()
+        self.conns = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self.lock:
+                if len(self.conns) < self.size:
+                    conn = self.factory()
+                    self.conns.append(conn)
+            if conn is None:
+                conn = self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    def close(self):
+        with self.lock:
+            for conn in self.conns:
+                conn.close()
+            self.conns = []
+
+def _db_connector(db_url):
+    # 返回 (建立连接的函数, 参数占位符, 连接数上限)；SQLite 同一时间只有一个写者，只用一个连接
+    parsed = urllib.parse.urlparse(db_url)
+    if parsed.scheme == 'sqlite':
+        path = db_url[len('sqlite:///'):]
+
+        def connect():
+            conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+            conn.execute(SQLITE_PROBLEM_SCHEMA)
+            conn.commit()
+            return conn
+        return connect, '?', 1
+    if parsed.scheme == 'mysql':
+        try:
+            import pymysql
+        except ImportError:
+            raise RuntimeError('--load mysql:// 需要安装 pymysql：pip install pymysql')
+
+        def connect():
+            return pymysql.connect(host=parsed.hostname or 'localhost', port=parsed.port or 3306,
+                                   user=urllib.parse.unquote(parsed.username or 'root'),
+                                   password=urllib.parse.unquote(parsed.password or ''),
+                                   database=parsed.path.lstrip('/') or 'jol', charset='utf8mb4', autocommit=False)
+        return connect, '%s', None
+    raise ValueError(f'不支持的数据库地址: {db_url}（应为 sqlite:///路径 或 mysql://用户:密码@主机:端口/库名）')
+
+def _write_data_samples(data_dir, db_problem_id, problem_data):
+    problem_dir = os.path.join(data_dir, str(db_problem_id))
+    os.makedirs(problem_dir, exist_ok=True)
+    with open(os.path.join(problem_dir, 'sample.in'), 'w', encoding='utf-8') as f:
+        f.write(problem_data.get('sample_input',''))
+    with open(os.path.join(problem_dir, 'sample.out'), 'w', encoding='utf-8') as f:
+        f.write(problem_data.get('sample_output',''))
+
+def load_problems(problems, db_url, batch_size=500, pool_size=4, data_dir=None, state=None):
+    # 直接写库：参数化 executemany，每批一个事务，多个批次经连接池并行导入。
+    # 按 remote_id 跳过已导入的题目，中断后重跑只会补上未提交的批次。
+    # 传入 state（--incremental）时指纹未变的题目不进入批次，已导入且指纹变化的题目按 remote_id UPDATE，
+    # 每批提交后才更新这一批的指纹
+    from concurrent.futures import ThreadPoolExecutor
+    connect, mark, max_pool = _db_connector(db_url)
+    pool = ConnectionPool(connect, min(pool_size, max_pool) if max_pool else pool_size)
+    columns = ', '.join(f'`{c}`' for c in PROBLEM_COLUMNS)
+    insert_sql = f"INSERT INTO `problem` ({columns}) VALUES ({', '.join([mark]*len(PROBLEM_COLUMNS))})"
+    # 与 problem_sql_update 相同，只更新题面相关字段
+    update_sql = (f"UPDATE `problem` SET {', '.join(f'`{c}` = {mark}' for c in FINGERPRINT_FIELDS)} "
+                  f"WHERE `remote_oj` = {mark} AND `remote_id` = {mark}")
+    in_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def load_batch(batch):
+        ids = [str(pid) for pid, _, _ in batch]
+        lookup = f"SELECT `problem_id`, `remote_id` FROM `problem` WHERE `remote_oj` = {mark} AND `remote_id` IN ({', '.join([mark]*len(ids))})"
+        with METRICS.timer('db_load'), pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(lookup, [REMOTE_OJ] + ids)
+                loaded = {r[1] for r in cur.fetchall()}
+                rows = []
+                updates = []
+                for pid, pdata, _ in batch:
+                    if str(pid) in loaded and state is None:
+                        continue
+                    row = problem_row(pdata, pid, in_date)
+                    if row is None:
+                        continue
+                    if str(pid) in loaded:
+                        updates.append(row[:6] + row[10:12] + (REMOTE_OJ, str(pid)))
+                    else:
+                        rows.append(row)
+                if rows:
+                    cur.executemany(insert_sql, rows)
+                if updates:
+                    cur.executemany(update_sql, updates)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            if data_dir:
+                cur.execute(lookup, [REMOTE_OJ] + ids)
+                db_ids = {r[1]: r[0] for r in cur.fetchall()}
+                for pid, pdata, _ in batch:
+                    if str(pid) in db_ids and pdata.get('exists', True):
+                        _write_data_samples(data_dir, db_ids[str(pid)], pdata)
+            cur.close()
+        return len(rows), len(updates), len(loaded) - len(updates)
+
+    def batches():
+        batch = []
+        for pid_str, pdata in problems.items():
+            try:
+                pid = int(pid_str)
+            except Exception:
+                continue
+            if not pdata or not pdata.get('exists', True):
+                continue
+            fp = None
+            if state is not None:
+                fp = problem_fingerprint(pdata)
+                if state.get(pid) == fp:
+                    counts['unchanged'] += 1
+                    continue
+            batch.append((pid, pdata, fp))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    # 先建立一个连接，地址或账号有误时立即报错，而不是每个批次各失败一次
+    with pool.connection():
+        pass
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0, 'unchanged': 0, 'failed': 0}
+    window = deque()
+
+    def collect():
+        batch, fut = window.popleft()
+        try:
+            n, u, k = fut.result()
+            counts['inserted'] += n
+            counts['updated'] += u
+            counts['skipped'] += k
+            if state is not None:
+                state.update([(pid, fp) for pid, _, fp in batch])
+        except Exception:
+            logging.exception('导入批次失败（题号 %s-%s），重跑 --load 即可补上', batch[0][0], batch[-1][0])
+            counts['failed'] += len(batch)
+
+    try:
+        with ThreadPoolExecutor(max_workers=pool.size) as ex:
+            # 在途批次数有上限，避免一次性把全部题目读入内存
+            for batch in batches():
+                window.append((batch, ex.submit(load_batch, batch)))
+                while len(window) > pool.size * 2 or (window and window[0][1].done()):
+                    collect()
+            while window:
+                collect()
+    finally:
+        pool.close()
+    if state is None:
+        print(f"已导入数据库: 新增 {counts['inserted']}，已存在跳过 {counts['skipped']}，失败 {counts['failed']}")
+    else:
+        print(f"已增量导入数据库: 新增 {counts['inserted']}，更新 {counts['updated']}，"
+              f"未变化 {counts['unchanged']}，失败 {counts['failed']}")
+    return counts['inserted']
+
+class CheckpointStore:
+    # 断点存储：SQLite WAL 模式，每道题爬完立即提交；题号为主键，续爬时按题号 O(1) 查询
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # 设置 search_index 后每道题提交时同步更新全文索引（--index）
+        self.search_index = None
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS problems (pid INTEGER PRIMARY KEY, data TEXT NOT NULL)')
+        # 死信：多次重试仍失败的题号和最后一次失败原因；题目爬取成功后删除
+        self.conn.execute('CREATE TABLE IF NOT EXISTS dead_letter (pid INTEGER PRIMARY KEY, reason TEXT NOT NULL, '
+                          'attempts INTEGER NOT NULL, updated REAL NOT NULL)')
+        self.conn.commit()
+
+    def put(self, problem_id, problem_data):
+        payload = json.dumps(problem_dict(problem_data), ensure_ascii=False)
+        with METRICS.timer('checkpoint_write'), self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO problems (pid, data) VALUES (?, ?)', (int(problem_id), payload))
+            self.conn.execute('DELETE FROM dead_letter WHERE pid = ?', (int(problem_id),))
+            self.conn.commit()
+        if self.search_index is not None:
+            self.search_index.update(problem_id, problem_data)
+
+    def add_dead(self, problem_id, reason, attempts):
+        # 尝试次数跨多次运行累加
+        with self.lock:
+            self.conn.execute('INSERT INTO dead_letter (pid, reason, attempts, updated) VALUES (?, ?, ?, ?) '
+                              'ON CONFLICT(pid) DO UPDATE SET reason = excluded.reason, '
+                              'attempts = dead_letter.attempts + excluded.attempts, updated = excluded.updated',
+                              (int(problem_id), reason, attempts, time.time()))
+            self.conn.commit()
+
+    def dead_letters(self, start_id=None, end_id=None):
+        lo = start_id if start_id is not None else -1
+        hi = end_id if end_id is not None else 2**62
+        with self.lock:
+            return self.conn.execute('SELECT pid, reason, attempts FROM dead_letter WHERE pid BETWEEN ? AND ? ORDER BY pid',
+                                     (lo, hi)).fetchall()
+
+    def has(self, problem_id):
+        with self.lock:
+            row = self.conn.execute('SELECT 1 FROM problems WHERE pid = ?', (int(problem_id),)).fetchone()
+        return row is not None
+
+    def get(self, problem_id):
+        with self.lock:
+            row = self.conn.execute('SELECT data FROM problems WHERE pid = ?', (int(problem_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM problems').fetchone()[0]
+
+    def items(self):
+        # 按题号顺序分批读出，与 JSON 快照的 {str(pid): pdata} 结构一致，不一次性载入内存
+        last = -1
+        while True:
+            with self.lock:
+                batch = self.conn.execute('SELECT pid, data FROM problems WHERE pid > ? ORDER BY pid LIMIT 500', (last,)).fetchall()
+            if not batch:
+                return
+            for pid, data in batch:
+                yield str(pid), json.loads(data)
+            last = batch[-1][0]
+
+    def import_json(self, json_file):
+        with open(json_file, 'r', encoding='utf-8') as jf:
+            prev = json.load(jf)
+        rows = []
+        for k, v in prev.items():
+            try:
+                rows.append((int(k), json.dumps(v, ensure_ascii=False)))
+            except Exception:
+                continue
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO problems (pid, data) VALUES (?, ?)', rows)
+            self.conn.commit()
+        return len(rows)
+
+    def export_json(self, json_file):
+        # 流式写出，格式与 json.dump(..., ensure_ascii=False, indent=2) 完全相同
+        tmp_file = json_file + '.tmp'
+        count = 0
+        with open(tmp_file, 'w', encoding='utf-8') as jf:
+            for pid, pdata in self.items():
+                jf.write('{\n  ' if count == 0 else ',\n  ')
+                jf.write(json.dumps(pid) + ': ' + json.dumps(pdata, ensure_ascii=False, indent=2).replace('\n', '\n  '))
+                count += 1
+            jf.write('\n}' if count else '{}')
+        os.replace(tmp_file, json_file)
+        return count
+
+    def merge_from(self, path):
+        # 把另一个断点存储（分片）整体并入，同题号以后并入的为准
+        with self.lock:
+            self.conn.execute('ATTACH DATABASE ? AS shard', (path,))
+            try:
+                count = self.conn.execute('INSERT OR REPLACE INTO problems (pid, data) SELECT pid, data FROM shard.problems').rowcount
+                self.conn.commit()
+            finally:
+                self.conn.execute('DETACH DATABASE shard')
+        return count
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class WorkQueue:
+    # 分布式任务队列：SQLite 文件锁，多个进程/节点按批租用题号；租约超时未完成的题号由其他 worker 接手，
+    # 失败的题号退避后自动重试，超过次数记为 dead
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA busy_timeout=60000')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS tasks (pid INTEGER PRIMARY KEY, state TEXT NOT NULL, owner TEXT, '
+                          'not_before REAL NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, not_before)')
+
+    def shard_path(self, owner):
+        # 每个 worker 写自己的分片断点存储，放在队列文件旁边
+        shard_dir = os.path.splitext(self.path)[0] + '_shards'
+        os.makedirs(shard_dir, exist_ok=True)
+        return os.path.join(shard_dir, f'{sanitize_name(owner)}.db')
+
+    def shard_paths(self):
+        shard_dir = os.path.splitext(self.path)[0] + '_shards'
+        if not os.path.isdir(shard_dir):
+            return []
+        return sorted(os.path.join(shard_dir, f) for f in os.listdir(shard_dir) if f.endswith('.db'))
+
+    def seed(self, id_list):
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.executemany("INSERT OR IGNORE INTO tasks (pid, state) VALUES (?, 'pending')", ((int(pid),) for pid in id_list))
+        self.conn.execute('COMMIT')
+
+    def lease(self, owner, n, lease_seconds):
+        # 待处理的题号和租约已过期的题号都可以租用；leased 状态下 not_before 即租约到期时间
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = self.conn.execute("SELECT pid FROM tasks WHERE state IN ('pending', 'leased') AND not_before <= ? ORDER BY pid LIMIT ?",
+                                     (now, n)).fetchall()
+            ids = [r[0] for r in rows]
+            self.conn.executemany("UPDATE tasks SET state = 'leased', owner = ?, not_before = ? WHERE pid = ?",
+                                  ((owner, now + lease_seconds, pid) for pid in ids))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return ids
+
+    def complete(self, id_list):
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.executemany("UPDATE tasks SET state = 'done', owner = NULL WHERE pid = ?", ((int(pid),) for pid in id_list))
+        self.conn.execute('COMMIT')
+
+    def fail(self, owner, id_list, max_attempts, retry_delay):
+        # 只处理仍由本 worker 持有的租约，避免覆盖其他 worker 已完成的结果
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        for pid in id_list:
+            self.conn.execute("UPDATE tasks SET attempts = attempts + 1, owner = NULL, "
+                              "state = CASE WHEN attempts + 1 >= ? THEN 'dead' ELSE 'pending' END, "
+                              "not_before = ? + ? * (attempts + 1) WHERE pid = ? AND state = 'leased' AND owner = ?",
+                              (max_attempts, now, retry_delay, int(pid), owner))
+        self.conn.execute('COMMIT')
+
+    def counts(self):
+        return dict(self.conn.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall())
+
+    def dead_ids(self):
+        return [r[0] for r in self.conn.execute("SELECT pid FROM tasks WHERE state = 'dead' ORDER BY pid")]
+
+    def close(self):
+        self.conn.close()
+
+def run_queue_worker(queue, owner, crawl_batch, batch_size=50, lease_seconds=600, max_attempts=3, retry_delay=30, poll=5.0):
+    # 循环租用一批题号交给 crawl_batch 爬取（返回失败的题号），直到队列中没有待处理或被租用的题号
+    while True:
+        ids = queue.lease(owner, batch_size, lease_seconds)
+        if not ids:
+            counts = queue.counts()
+            if not counts.get('pending') and not counts.get('leased'):
+                break
+            # 其余题号正被其他 worker 处理或处于重试退避中，等租约完成或过期
+            time.sleep(poll)
+            continue
+        logging.info('已租用题号 %s-%s（%s 项）', ids[0], ids[-1], len(ids))
+        failed = set(crawl_batch(ids))
+        queue.complete([pid for pid in ids if pid not in failed])
+        if failed:
+            logging.warning('本批失败，稍后重试: %s', sorted(failed))
+            queue.fail(owner, failed, max_attempts, retry_delay)
+    counts = queue.counts()
+    logging.info('队列已处理完：完成 %s，放弃 %s', counts.get('done', 0), counts.get('dead', 0))
+
+def _crawl_gated(problem_id, session, controller):
+    if controller is None:
+        return fetch_problem(problem_id, session)
+    controller.acquire()
+    try:
+        return fetch_problem(problem_id, session)
+    finally:
+        controller.release()
+
+def _collect_result(problem_id, data, results, failed, store, pipeline=None):
+    # 传入 store 时结果立即提交到断点存储，不在内存中保留
+    if pipeline is not None:
+        data = pipeline.finalize(problem_id, data)
+    if not data:
+        METRICS.inc('problems_total', result='failed')
+        failed.append(problem_id)
+        return
+    METRICS.inc('problems_total', result='ok' if data.get('exists', True) else 'missing')
+    if IMAGE_PROCESSOR is not None:
+        images = IMAGE_PROCESSOR.pop_sizes(problem_id)
+        if images:
+            data['images'] = images
+    if data.get('exists', True):
+        try:
+            save_sample_files(data, problem_id)
+        except Exception:
+            logging.exception('保存样例失败: %s', problem_id)
+    if store is not None:
+        store.put(problem_id, data)
+    else:
+        results[problem_id] = data
+
+def _page_session(limiter, controller, pipeline, pool_size=10):
+    # 没有独立图片线程池时图片也走这个会话，保留 urllib3 的重试
+    session = make_session(limiter, controller, pool_size, retries=pipeline is None)
+    session.image_pipeline = pipeline
+    return session
+
+def crawl_ids_concurrent(id_list, max_workers=3, rate_delay=0.5, controller=None, store=None, image_workers=8, scheduler=None):
+    from concurrent.futures import ThreadPoolExecutor
+    results = {}
+    failed = []
+    scheduler = scheduler or RetryScheduler(dead_letter=store)
+    limiter = TokenBucket.from_interval(rate_delay)
+    # 图片走独立的下载线程池，页面 worker 不等待图片
+    pipeline = ImagePipeline(make_session(limiter, controller), image_workers) if image_workers > 0 else None
+    # 启用自适应并发时线程池按上限创建，实际并发由控制器放行
+    pool_size = controller.maximum if controller else max_workers
+    # 所有页面 worker 共用一个会话，连接池与线程数一样大，keep-alive 连接跨题目复用
+    session = _page_session(limiter, controller, pipeline, pool_size)
+    try:
+        with ThreadPoolExecutor(max_workers=pool_size) as ex:
+            submit = lambda pid: ex.submit(_crawl_gated, pid, session, controller)
+            # 在途任务有上限，已完成的 future 不再被引用，提交到断点存储的记录随即释放
+            for pid, data in scheduler.run(id_list, submit, pool_size*2):
+                try:
+                    _collect_result(pid, data, results, failed, store, pipeline)
+                except Exception:
+                    logging.exception('并发爬取时异常: %s', pid)
                     failed.append(pid)
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+    return results, failed
+
+def crawl_ids_sequential(id_list, rate_delay=0.5, store=None, image_workers=8, scheduler=None):
+    # 单线程逐题抓取；失败的题号同样交给 RetryScheduler 稍后重试，不阻塞后面的题目
+    results = {}
+    failed = []
+    scheduler = scheduler or RetryScheduler(dead_letter=store)
+    limiter = TokenBucket.from_interval(rate_delay)
+    pipeline = ImagePipeline(make_session(limiter), image_workers) if image_workers > 0 else None
+    session = _page_session(limiter, None, pipeline)
+    try:
+        for pid, data in scheduler.run(id_list, lambda pid: _completed(fetch_problem, pid, session), 1):
+            _collect_result(pid, data, results, failed, store, pipeline)
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+    return results, failed
+
+class PageArchive:
+    # 原始页面和图片正文的压缩归档：记录顺序追加到段文件，SQLite 索引记录段号、偏移和长度，读取走 mmap。
+    # 每条记录带头部（魔数、压缩方式、键长、正文长），索引损坏时仍可顺序扫描段文件恢复。
+    # 多个进程（--queue 的各 worker）可共用同一归档：写入时持有 lock 文件的排他锁，偏移取段文件的实际末尾
+    RECORD = struct.Struct('<4sBII')
+    MAGIC = b'YBTA'
+    CODECS = {'zlib': 0, 'zstd': 1}
+
+    def __init__(self, archive_dir, segment_bytes=256*1024**2):
+        self.archive_dir = archive_dir
+        self.segment_bytes = segment_bytes
+        os.makedirs(archive_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(archive_dir, 'index.db'), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS records (key TEXT PRIMARY KEY, segment INTEGER NOT NULL, offset INTEGER NOT NULL, '
+                          'length INTEGER NOT NULL, codec TEXT NOT NULL, size INTEGER NOT NULL, sha256 TEXT NOT NULL, meta TEXT NOT NULL)')
+        self.conn.commit()
+        try:
+            import zstandard
+            self.zstd = zstandard
+            self.codec = 'zstd'
+        except ImportError:
+            self.zstd = None
+            self.codec = 'zlib'
+        try:
+            import fcntl
+            self.fcntl = fcntl
+        except ImportError:
+            # Windows 上没有 fcntl，只保证同一进程内的线程互斥
+            self.fcntl = None
+        self.lock_fh = open(os.path.join(archive_dir, 'lock'), 'ab')
+        segments = [int(f[4:9]) for f in os.listdir(archive_dir) if f.startswith('seg-') and f.endswith('.dat')]
+        self.segment = max(segments) if segments else 0
+        self.fh = open(self._segment_path(self.segment), 'ab')
+        self.maps = {}
+        self.local = threading.local()
+
+    def _segment_path(self, segment):
+        return os.path.join(self.archive_dir, f'seg-{segment:05d}.dat')
+
+    def _compress(self, data):
+        if self.codec == 'zstd':
+            # ZstdCompressor 不能跨线程共用，每个线程一个
+            cctx = getattr(self.local, 'cctx', None)
+            if cctx is None:
+                cctx = self.local.cctx = self.zstd.ZstdCompressor(level=3)
+            return cctx.compress(data)
+        return zlib.compress(data, 6)
+
+    def _decompress(self, codec, payload):
+        if codec == 'zlib':
+            return zlib.decompress(payload)
+        if self.zstd is None:
+            raise RuntimeError('归档中有 zstd 压缩的记录，需要安装 zstandard：pip install zstandard')
+        dctx = getattr(self.local, 'dctx', None)
+        if dctx is None:
+            dctx = self.local.dctx = self.zstd.ZstdDecompressor()
+        return dctx.decompress(payload)
+
+    @contextmanager
+    def _file_lock(self):
+        if self.fcntl is None:
+            yield
+            return
+        self.fcntl.flock(self.lock_fh.fileno(), self.fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            self.fcntl.flock(self.lock_fh.fileno(), self.fcntl.LOCK_UN)
+
+    def put(self, key, data, meta=''):
+        digest = hashlib.sha256(data).hexdigest()
+        payload = self._compress(data)
+        kb = key.encode('utf-8')
+        with self.lock, self._file_lock():
+            row = self.conn.execute('SELECT sha256 FROM records WHERE key = ?', (key,)).fetchone()
+            if row and row[0] == digest:
+                return False
+            # 其他进程可能已经切换到新段，追加到最新的段
+            if os.path.exists(self._segment_path(self.segment + 1)):
+                while os.path.exists(self._segment_path(self.segment + 1)):
+                    self.segment += 1
+                self.fh.close()
+                self.fh = open(self._segment_path(self.segment), 'ab')
+            end = os.fstat(self.fh.fileno()).st_size
+            if end and end + len(payload) > self.segment_bytes:
+                self.fh.close()
+                self.segment += 1
+                self.fh = open(self._segment_path(self.segment), 'ab')
+                end = 0
+            offset = end + self.RECORD.size + len(kb)
+            self.fh.write(self.RECORD.pack(self.MAGIC, self.CODECS[self.codec], len(kb), len(payload)))
+            self.fh.write(kb)
+            self.fh.write(payload)
+            self.fh.flush()
+            self.conn.execute('INSERT OR REPLACE INTO records (key, segment, offset, length, codec, size, sha256, meta) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (key, self.segment, offset, len(payload), self.codec, len(data), digest, meta))
+            self.conn.commit()
+        METRICS.inc('archive_bytes_total', len(payload), kind=key.split(':', 1)[0])
+        return True
+
+    def _map(self, segment, end):
+        with self.lock:
+            m = self.maps.get(segment)
+            if m is None or len(m) < end:
+                # 当前段还在追加，映射长度不够时重新映射；旧映射留给仍在读取的线程，由 GC 回收
+                with open(self._segment_path(segment), 'rb') as f:
+                    m = self.maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return m
+
+    def read(self, row):
+        # 记录损坏（解压失败或内容哈希不符）时记录日志并返回 None，调用方按缺失处理
+        segment, offset, length, codec, sha256, meta = row
+        m = self._map(segment, offset + length)
+        try:
+            data = self._decompress(codec, m[offset:offset+length])
+        except RuntimeError:
+            # 缺少 zstandard 是环境问题，不算记录损坏
+            raise
+        except Exception:
+            data = None
+        if data is None or hashlib.sha256(data).hexdigest() != sha256:
+            logging.warning('归档记录校验失败，已跳过: 段 %s 偏移 %s', segment, offset)
+            METRICS.inc('archive_corrupt_total')
+            return None, meta
+        return data, meta
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT segment, offset, length, codec, sha256, meta FROM records WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None, None
+        return self.read(row)
+
+    def locate(self, keys):
+        # 一次查出所有位置并按段文件中的物理顺序排序，批量读取时是一次顺序扫描，不再逐条查索引
+        wanted = set(keys)
+        with self.lock:
+            rows = self.conn.execute('SELECT key, segment, offset, length, codec, sha256, meta FROM records ORDER BY segment, offset').fetchall()
+        return [(r[0], r[1:]) for r in rows if r[0] in wanted]
+
+    def close(self):
+        with self.lock:
+            self.fh.close()
+            self.lock_fh.close()
+            for m in self.maps.values():
+                m.close()
+            self.maps = {}
+            self.conn.close()
+
+def page_key(problem_id):
+    return f'page:{problem_id}'
+
+def _archive_image(img_url, blob_path, ext):
+    if RAW_ARCHIVE is None:
+        return
+    try:
+        with open(blob_path, 'rb') as f:
+            RAW_ARCHIVE.put(f'image:{img_url}', f.read(), ext)
+    except Exception:
+        logging.exception('归档图片失败: %s', img_url)
+
+RAW_PAGE_DIR = 'pages'
+
+def raw_page_path(problem_id):
+    return os.path.join(RAW_PAGE_DIR, f'{problem_id}.html')
+
+def save_raw_page(problem_id, page_text):
+    if RAW_ARCHIVE is not None:
+        RAW_ARCHIVE.put(page_key(problem_id), page_text.encode('utf-8'))
+        return
+    os.makedirs(RAW_PAGE_DIR, exist_ok=True)
+    path = raw_page_path(problem_id)
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(page_text)
+    os.replace(tmp_path, path)
+
+def load_raw_page(problem_id):
+    # 页面不存在时抛出 FileNotFoundError，归档记录损坏时抛出 ValueError；都不可重试，由调用方写入死信
+    if RAW_ARCHIVE is not None:
+        data, meta = RAW_ARCHIVE.get(page_key(problem_id))
+        if data is None:
+            if meta is None:
+                raise FileNotFoundError(f'归档中没有题目 {problem_id} 的页面')
+            raise ValueError(f'归档中题目 {problem_id} 的页面记录已损坏')
+        return data.decode('utf-8')
+    with open(raw_page_path(problem_id), 'r', encoding='utf-8') as f:
+        return f.read()
+
+def _fetch_raw_page(problem_id, session, controller):
+    # 第一阶段：只下载并保存原始页面，不做解析
+    url = problem_url(problem_id)
+    if controller:
+        controller.acquire()
+    try:
+        print(f'正在爬取题目 {problem_id}...')
+        with METRICS.timer('fetch'):
+            resp = session.get(url, timeout=10)
+            resp.encoding = 'utf-8'
+            METRICS.inc('bytes_total', len(resp.content), kind='page')
+        if resp.status_code != 200:
+            print(f'请求失败，状态码: {resp.status_code}')
+            raise FetchError(resp.status_code, _retry_after(resp.headers))
+        save_raw_page(problem_id, resp.text)
+        return resp.text
+    finally:
+        if controller:
+            controller.release()
+
+def _init_parse_worker(skip_images, parser_backend, base_url):
+    global SKIP_IMAGES, PARSER_BACKEND, BASE_URL
+    SKIP_IMAGES = skip_images
+    PARSER_BACKEND = parser_backend
+    BASE_URL = base_url
+
+def _parse_in_worker(page_text, problem_id):
+    # 第二阶段（子进程）：解析页面，图片只登记不下载
+    # 子进程里的 METRICS 不会回到主进程，解析耗时随结果一起返回
+    recorder = _ImageRecorder()
+    session = types.SimpleNamespace(image_pipeline=recorder)
+    t0 = time.perf_counter()
+    data = parse_problem_page(page_text, problem_id, problem_url(problem_id), session)
+    return data, recorder.items, time.perf_counter()-t0
+
+def _parse_pool(parse_workers):
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=parse_workers, initializer=_init_parse_worker,
+                               initargs=(SKIP_IMAGES, PARSER_BACKEND, BASE_URL))
+
+# 取页面的线程异常退出时放入 done_q 的标记，主线程收到后重新抛出该异常
+_FEED_FAILED = object()
+
+def _run_parse_stage(id_list, pages, parse_workers, pipeline, store, queue_size, scheduler):
+    # 解析阶段：pages 依次产出 id_list 中每个题号的 (pid, 页面文本)，None 表示失败（已由产出方写入死信）。
+    # 已取到但未提交的页面最多 queue_size 个，取页面的一方在队列满时阻塞，形成背压。解析失败经 scheduler 写入死信
+    results = {}
+    failed = []
+    slots = threading.BoundedSemaphore(queue_size)
+    done_q = queue.Queue()
+
+    with _parse_pool(parse_workers) as parse_ex:
+        def on_page(pid, page_text):
+            if page_text is None:
+                done_q.put((pid, None))
+                return
+            pfut = parse_ex.submit(_parse_in_worker, page_text, pid)
+            pfut.add_done_callback(lambda f: done_q.put((pid, f)))
+
+        def feed():
+            try:
+                for pid, page_text in pages:
+                    slots.acquire()
+                    on_page(pid, page_text)
+            except BaseException as e:
+                # 之后不会再有页面，主线程不能继续在 done_q 上等待
+                done_q.put((_FEED_FAILED, e))
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        for _ in range(len(id_list)):
+            pid, fut = done_q.get()
+            if pid is _FEED_FAILED:
+                raise fut
+            data = None
+            if fut is not None:
+                try:
+                    data, images, parse_seconds = fut.result()
+                    METRICS.observe('parse', parse_seconds)
+                    for placeholder, idx, img_url, orig_src in images:
+                        pipeline.adopt(pid, placeholder, idx, img_url, orig_src)
+                    if data is None:
+                        raise ParseError()
+                except Exception as e:
+                    logging.error('解析题目 %s 时出错，写入死信: %s', pid, failure_reason(e), exc_info=e)
+                    data = None
+                    scheduler.give_up(pid, 0, e)
+            try:
+                _collect_result(pid, data, results, failed, store, pipeline)
             except Exception:
                 logging.exception('并发爬取时异常: %s', pid)
                 failed.append(pid)
+            slots.release()
+        feeder.join()
+    return results, failed
+
+def crawl_ids_pipelined(id_list, max_workers=3, parse_workers=None, rate_delay=0.5, controller=None, store=None, image_workers=8, queue_size=256, saved_ids=(), scheduler=None):
+    # 两阶段流水线：线程池只负责网络 I/O 并保存原始页面，进程池在所有 CPU 核上解析
+    # saved_ids 中的题目页面已由发现阶段保存，直接从 pages/ 读取
+    from concurrent.futures import ThreadPoolExecutor
+    parse_workers = parse_workers or os.cpu_count() or 1
+    scheduler = scheduler or RetryScheduler(dead_letter=store)
+    limiter = TokenBucket.from_interval(rate_delay)
+    image_workers = max(1, image_workers)
+    pipeline = ImagePipeline(make_session(limiter, controller, image_workers), image_workers)
+    pool_size = controller.maximum if controller else max_workers
+    # 所有 I/O worker 共用一个会话和连接池
+    session = make_session(limiter, controller, pool_size, retries=False)
+    try:
+        with ThreadPoolExecutor(max_workers=pool_size) as fetch_ex:
+            def submit(pid):
+                if pid in saved_ids:
+                    return _completed(load_raw_page, pid)
+                return fetch_ex.submit(_fetch_raw_page, pid, session, controller)
+            return _run_parse_stage(id_list, scheduler.run(id_list, submit, pool_size*2), parse_workers, pipeline, store, queue_size, scheduler)
+    finally:
+        pipeline.close()
+
+def reparse_ids(id_list, parse_workers=None, store=None, queue_size=256):
+    # 仅重新解析 pages/ 下已保存的原始页面，不访问网络；图片使用本地已下载的文件
+    parse_workers = parse_workers or os.cpu_count() or 1
+    if RAW_ARCHIVE is not None:
+        located = {int(key.split(':', 1)[1]): row for key, row in RAW_ARCHIVE.locate(page_key(pid) for pid in id_list)}
+        ids = list(located)
+    else:
+        located = None
+        ids = [pid for pid in id_list if os.path.exists(raw_page_path(pid))]
+    pipeline = ImagePipeline(None, 1)
+    scheduler = RetryScheduler(dead_letter=store)
+
+    def pages():
+        # 单个页面读取失败（归档记录损坏、文件不可读）只记为该题失败并写入死信，其余页面照常解析
+        for pid in ids:
+            try:
+                if located is not None:
+                    data = RAW_ARCHIVE.read(located[pid])[0]
+                    if data is None:
+                        raise ValueError(f'归档中题目 {pid} 的页面记录已损坏')
+                    page_text = data.decode('utf-8')
+                else:
+                    page_text = load_raw_page(pid)
+            except Exception as e:
+                logging.exception('读取已保存的页面 %s 失败', pid)
+                scheduler.give_up(pid, 0, e)
+                page_text = None
+            yield pid, page_text
+    try:
+        return _run_parse_stage(ids, pages(), parse_workers, pipeline, store, queue_size, scheduler)
+    finally:
+        pipeline.close()
+
+_TITLE_H3_RE = re.compile(r'<h3[^>]*>(.*?)</h3>', re.S | re.I)
+# 题面开始的标记：读到这里仍没有题号标题即判定不存在
+_PROBE_CONTENT_RE = re.compile(r'<h4|pshow\(|<pre', re.I)
+# 既没有 h3 也没有题面标记的页面，读到这么多字符即判定不存在
+PROBE_LIMIT = 32768
+
+def probe_problem(problem_id, session):
+    # 流式读取页面，只看标题所在的第一个 h3：不含题号，或读到题面标记仍没有标题时立即断开；存在的题目读完整页返回。
+    # session 不能经过缓存 adapter，否则整页在 iter_content 之前就已读完
+    key = str(problem_id)
+    try:
+        with METRICS.timer('probe'), session.get(problem_url(problem_id), timeout=10, stream=True) as resp:
+            if resp.status_code != 200:
+                METRICS.inc('probes_total', result='error')
+                return None, None
+            decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            text = ''
+            found = False
+            size = 0
+            for chunk in resp.iter_content(chunk_size=4096):
+                size += len(chunk)
+                text += decoder.decode(chunk)
+                if found:
+                    continue
+                m = _TITLE_H3_RE.search(text)
+                if m:
+                    found = key in re.sub(r'<[^>]+>', '', m.group(1))
+                    if not found:
+                        break
+                elif _PROBE_CONTENT_RE.search(text) or len(text) > PROBE_LIMIT:
+                    break
+            METRICS.inc('bytes_total', size, kind='page')
+            if not found:
+                METRICS.inc('probes_total', result='missing')
+                return False, None
+            METRICS.inc('probes_total', result='exists')
+            return True, text + decoder.decode(b'', final=True)
+    except Exception:
+        logging.exception('探测题目 %s 失败', problem_id)
+        METRICS.inc('probes_total', result='error')
+        return None, None
+
+class KnownIds:
+    # 题号存在性记录：确认不存在的题号在 TTL 内不再探测，跨范围、跨运行共用。
+    # 跳跃探测时推断不存在的题号只记录不采信，下次运行仍会进入探测（跳跃探测下代价很小），空段中新增的题目不会被漏掉
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS known (pid INTEGER PRIMARY KEY, present INTEGER NOT NULL, inferred INTEGER NOT NULL, checked REAL NOT NULL)')
+        self.conn.commit()
+        self.pending = []
+
+    def is_missing(self, problem_id, ttl):
+        row = self.conn.execute('SELECT present, inferred, checked FROM known WHERE pid = ?', (int(problem_id),)).fetchone()
+        return row is not None and not row[0] and not row[1] and time.time() - row[2] < ttl
+
+    def mark(self, problem_id, present, inferred=False):
+        self.pending.append((int(problem_id), int(present), int(inferred), time.time()))
+        if len(self.pending) >= 500:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.conn.executemany('INSERT OR REPLACE INTO known (pid, present, inferred, checked) VALUES (?, ?, ?, ?)', self.pending)
+            self.conn.commit()
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def discover_ids(id_list, known, max_workers=3, rate_delay=0.5, controller=None, ttl_days=7, gap=16):
+    # 发现阶段：跳过 TTL 内已知不存在的题号，其余按窗口并发探测；连续 gap 个空号后按倍增步长跳跃探测，
+    # 探到存在的题目再二分回找空段终点，跳过的题号记为推断不存在。存在的题目页面保存到 pages/
+    from concurrent.futures import ThreadPoolExecutor
+    ttl = ttl_days * 86400
+    todo = []
+    for pid in id_list:
+        if known.is_missing(pid, ttl):
+            METRICS.inc('ids_skipped_total', reason='known_missing')
+        else:
+            todo.append(pid)
+    limiter = TokenBucket.from_interval(rate_delay)
+    pool_size = controller.maximum if controller else max_workers
+    # 探测要在读到标题后断开连接，联网时不经过 HTTP 缓存；离线模式只能从缓存读
+    session = make_session(limiter, controller, pool_size, cache=HTTP_CACHE is not None and HTTP_CACHE.offline)
+    states = {}
+
+    def record(pid, state, page):
+        states[pid] = state
+        if state:
+            save_raw_page(pid, page)
+        if state is not None:
+            known.mark(pid, state)
+
+    def probe_one(idx):
+        pid = todo[idx]
+        if pid not in states:
+            record(pid, *probe_problem(pid, session))
+        return states[pid]
+
+    def infer_missing(lo, hi):
+        # todo[lo] 和 todo[hi] 都已确认不存在，中间的题号不再探测
+        for pid in todo[lo+1:hi]:
+            if pid not in states:
+                states[pid] = False
+                known.mark(pid, False, inferred=True)
+                METRICS.inc('ids_skipped_total', reason='inferred')
+
+    def gallop(lo):
+        # todo[lo] 不存在：步长倍增向后探测，返回下一个应线性探测的下标
+        stride = 2
+        while True:
+            hi = min(lo + stride, len(todo) - 1)
+            if hi == lo:
+                return len(todo)
+            if probe_one(hi) is not False:
+                break
+            infer_missing(lo, hi)
+            lo = hi
+            stride *= 2
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if probe_one(mid) is False:
+                infer_missing(lo, mid)
+                lo = mid
+            else:
+                hi = mid
+        return lo + 1
+
+    idx = 0
+    misses = 0
+    with ThreadPoolExecutor(max_workers=pool_size) as ex:
+        while idx < len(todo):
+            if gap and misses >= gap:
+                idx = gallop(idx - 1)
+                misses = 0
+                continue
+            window = [pid for pid in todo[idx:idx+pool_size] if pid not in states]
+            for pid, result in zip(window, ex.map(lambda p: probe_problem(p, session), window)):
+                record(pid, *result)
+            for pid in todo[idx:idx+pool_size]:
+                misses = misses + 1 if states[pid] is False else 0
+            idx += pool_size
+    known.flush()
+    existing = [pid for pid in todo if states.get(pid)]
+    unknown = [pid for pid in todo if states.get(pid) is None]
+    logging.info('发现阶段：存在 %s，不存在 %s，探测失败 %s，跳过已知不存在 %s',
+                 len(existing), len(todo)-len(existing)-len(unknown), len(unknown), len(id_list)-len(todo))
+    return existing, unknown
+
+def collect_image_urls(page_text, page_url):
+    # 预先找出页面 pshow 片段中引用的图片地址（与 process_images_in_html 的解析方式一致）
+    from bs4 import BeautifulSoup
+    urls = []
+    for m in re.finditer(r'pshow\("(.*?)"\)', page_text, re.DOTALL):
+        content = clean_html_content(m.group(1)).replace('\\n','\n').replace('\\t','\t')
+        if '<img' not in content:
+            continue
+        for img_tag in BeautifulSoup(content, 'html.parser').find_all('img'):
+            src = img_tag.get('src')
+            if not src:
+                continue
+            src = clean_html_content(src)
+            img_url = src if src.startswith('http') else urljoin(page_url, src)
+            if img_url not in urls:
+                urls.append(img_url)
+    return urls
+
+class _PrefetchedResponse:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def iter_content(self, chunk_size=8192):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i+chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _PrefetchedSession:
+    # 提供与 requests.Session.get 相同的接口，供解析代码读取异步预取的图片
+    def __init__(self, responses):
+        self.responses = responses
+
+    def get(self, url, **kwargs):
+        resp = self.responses.get(url)
+        if resp is None:
+            # 与同步会话抛出相同的异常类型；只在未命中时才导入 requests
+            import requests
+            raise requests.ConnectionError(f'图片未预取: {url}')
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+async def _async_get(client, url, timeout, limiter=None, controller=None, retries=RETRY_TOTAL):
+    import asyncio
+    import aiohttp
+    cache = HTTP_CACHE
+    entry = cache.lookup(url) if cache else None
+    if cache and cache.offline:
+        if entry is None:
+            import requests
+            raise requests.ConnectionError(f'离线模式下缓存未命中: {url}')
+        return _PrefetchedResponse(200, entry['headers'], cache.read(url, entry))
+    headers = cache.conditional_headers(entry) if entry else None
+    # 与 make_session 中 urllib3 Retry 的策略保持一致，但退避等待不占用线程
+    for attempt in range(retries+1):
+        if limiter:
+            await limiter.acquire_async()
+        t0 = time.monotonic()
+        try:
+            async with client.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                body = await resp.read()
+                METRICS.inc('http_responses_total', status=resp.status)
+                if controller:
+                    controller.record(time.monotonic()-t0, resp.status)
+                if resp.status == 304 and entry:
+                    return _PrefetchedResponse(200, entry['headers'], cache.read(url, entry, revalidated=True))
+                if resp.status == 200 and cache:
+                    cache.store(url, resp.headers, body)
+                if resp.status not in RETRY_STATUSES or attempt >= retries:
+                    return _PrefetchedResponse(resp.status, resp.headers.copy(), body)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            METRICS.inc('http_errors_total', error=type(e).__name__)
+            if controller:
+                controller.record(time.monotonic()-t0, None)
+            if attempt >= retries:
+                raise
+        METRICS.inc('http_retries_total', reason='async')
+        await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+async def _prefetch_image(client, img_url, limiter, controller):
+    t0 = time.perf_counter()
+    try:
+        resp = await _async_get(client, img_url, 15, limiter, controller)
+        METRICS.inc('bytes_total', len(resp.content), kind='image')
+        return resp
+    except Exception as e:
+        return e
+    finally:
+        METRICS.observe('image_fetch', time.perf_counter()-t0)
+
+def _coalesced_image(client, img_url, limiter, controller, image_tasks):
+    # 同一 URL 正在下载时复用同一个请求；完成后即从表中移除，不在整个运行期间持有图片正文
+    import asyncio
+    task = image_tasks.get(img_url)
+    if task is None:
+        task = asyncio.ensure_future(_prefetch_image(client, img_url, limiter, controller))
+        image_tasks[img_url] = task
+        task.add_done_callback(lambda _: image_tasks.pop(img_url, None))
+    return task
+
+async def _crawl_problem_async(client, problem_id, sem, limiter, controller, image_tasks):
+    # 失败时抛出异常，重试由 _crawl_retrying_async 在信号量之外安排
+    import asyncio
+    url = problem_url(problem_id)
+    async with sem:
+        if controller:
+            await controller.acquire_async()
+        try:
+            print(f'正在爬取题目 {problem_id}...')
+            t0 = time.perf_counter()
+            resp = await _async_get(client, url, 10, limiter, controller, retries=0)
+            METRICS.observe('fetch', time.perf_counter()-t0)
+            METRICS.inc('bytes_total', len(resp.content), kind='page')
+            if resp.status_code != 200:
+                print(f'请求失败，状态码: {resp.status_code}')
+                raise FetchError(resp.status_code, _retry_after(resp.headers))
+            page_text = resp.content.decode('utf-8', errors='replace')
+            if RAW_ARCHIVE is not None:
+                save_raw_page(problem_id, page_text)
+            images = {}
+            if not SKIP_IMAGES:
+                img_urls = collect_image_urls(page_text, url)
+                fetched = await asyncio.gather(*(_coalesced_image(client, u, limiter, controller, image_tasks) for u in img_urls))
+                images = dict(zip(img_urls, fetched))
+            # 解析和写图片是 CPU/磁盘操作，放到线程中执行以免阻塞事件循环
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(None, parse_problem_page, page_text, problem_id, url, _PrefetchedSession(images))
+            if data is None:
+                raise ParseError()
+            return data
+        finally:
+            if controller:
+                controller.release()
+
+async def _crawl_retrying_async(client, problem_id, sem, limiter, controller, image_tasks, scheduler):
+    import asyncio
+    attempt = 0
+    while True:
+        if scheduler.breaker:
+            await scheduler.breaker.wait_async()
+        try:
+            data = await _crawl_problem_async(client, problem_id, sem, limiter, controller, image_tasks)
+        except Exception as e:
+            delay = scheduler.failed(problem_id, attempt, e)
+            if delay is None:
+                return problem_id, None
+            # 退避等待不持有信号量，不占并发名额
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        scheduler.succeeded()
+        return problem_id, data
+
+async def _crawl_ids_async(id_list, max_inflight, rate_delay, controller, store, scheduler):
+    import asyncio
+    import aiohttp
+    results = {}
+    failed = []
+    limiter = TokenBucket.from_interval(rate_delay)
+    if controller:
+        max_inflight = max(max_inflight, controller.maximum)
+    connector = aiohttp.TCPConnector(limit=max_inflight, limit_per_host=max_inflight)
+    async with aiohttp.ClientSession(connector=connector, headers={'User-Agent': USER_AGENT}) as client:
+        sem = asyncio.Semaphore(max_inflight)
+        image_tasks = {}
+        # 已完成的 task 经队列交给主循环，处理后即不再被引用，提交到断点存储的记录随即释放
+        done_q = asyncio.Queue()
+        running = set()
+
+        def on_done(task):
+            running.discard(task)
+            done_q.put_nowait(task)
+        for pid in id_list:
+            task = asyncio.create_task(_crawl_retrying_async(client, pid, sem, limiter, controller, image_tasks, scheduler))
+            running.add(task)
+            task.add_done_callback(on_done)
+        for _ in range(len(id_list)):
+            pid, data = (await done_q.get()).result()
+            _collect_result(pid, data, results, failed, store)
     return results, failed
 
+def crawl_ids_async(id_list, max_inflight=100, rate_delay=0.5, controller=None, store=None, scheduler=None):
+    import asyncio
+    try:
+        import aiohttp  # noqa: F401
+    except ImportError:
+        raise RuntimeError('--async 模式需要安装 aiohttp：pip install aiohttp')
+    scheduler = scheduler or RetryScheduler(dead_letter=store)
+    return asyncio.run(_crawl_ids_async(id_list, max_inflight, rate_delay, controller, store, scheduler))
+
+def _make_scheduler(args, store):
+    breaker = CircuitBreaker(args.breaker_threshold, cooldown=args.breaker_cooldown) if args.breaker_threshold > 0 else None
+    return RetryScheduler(args.retry_attempts, args.retry_delay, breaker=breaker, dead_letter=store)
+
+def _run_crawl(args, ids, store, workers, use_concurrent, use_async, use_pipeline, parse_workers, rate_delay):
+    scheduler = _make_scheduler(args, store)
+    if args.discover:
+        # 发现阶段已下载存在题目的完整页面，直接交给两阶段流水线解析
+        w = workers if workers and workers>0 else (3 if use_concurrent else 1)
+        controller = AdaptiveConcurrency(w, args.adaptive) if args.adaptive else None
+        known = KnownIds(args.known_ids)
+        try:
+            existing, unknown = discover_ids(ids, known, max_workers=w, rate_delay=rate_delay, controller=controller,
+                                             ttl_days=args.missing_ttl, gap=args.gap)
+        finally:
+            known.close()
+        logging.info('使用两阶段流水线解析发现的题目： 解析进程=%s', parse_workers)
+        _, failed = crawl_ids_pipelined(sorted(existing + unknown), max_workers=w, parse_workers=parse_workers, rate_delay=rate_delay,
+                                        controller=controller, store=store, image_workers=args.image_workers, saved_ids=set(existing),
+                                        scheduler=scheduler)
+        return failed
+    elif args.reparse:
+        logging.info('仅重新解析已保存的原始页面： 解析进程=%s', parse_workers)
+        _, failed = reparse_ids(ids, parse_workers=parse_workers, store=store)
+        if failed:
+            logging.warning('重新解析失败: %s', failed)
+        return []
+    elif use_async or use_concurrent or use_pipeline:
+        if use_async:
+            n = args.use_async if args.use_async>0 else 100
+            controller = AdaptiveConcurrency(n, args.adaptive) if args.adaptive else None
+            logging.info('使用异步引擎： 最大并发请求=%s', n)
+            _, failed = crawl_ids_async(ids, max_inflight=n, rate_delay=rate_delay, controller=controller, store=store, scheduler=scheduler)
+        elif use_pipeline:
+            w = workers if workers and workers>0 else (3 if use_concurrent else 1)
+            controller = AdaptiveConcurrency(w, args.adaptive) if args.adaptive else None
+            logging.info('使用两阶段流水线： I/O workers=%s，解析进程=%s', w, parse_workers)
+            _, failed = crawl_ids_pipelined(ids, max_workers=w, parse_workers=parse_workers, rate_delay=rate_delay, controller=controller, store=store,
+                                            image_workers=args.image_workers, scheduler=scheduler)
+        else:
+            w = workers if workers and workers>0 else 3
+            controller = AdaptiveConcurrency(w, args.adaptive) if args.adaptive else None
+            logging.info('使用并发： workers=%s', w)
+            _, failed = crawl_ids_concurrent(ids, max_workers=w, rate_delay=rate_delay, controller=controller, store=store,
+                                             image_workers=args.image_workers, scheduler=scheduler)
+        return failed
+    else:
+        _, failed = crawl_ids_sequential(ids, rate_delay=rate_delay, store=store, image_workers=args.image_workers, scheduler=scheduler)
+        return failed
+
+def _index_sources(paths):
+    # 断点存储（.db）按题号分批读出；JSON 快照整体载入
+    for path in paths:
+        if path.endswith('.json'):
+            with open(path, 'r', encoding='utf-8') as jf:
+                yield path, list(json.load(jf, object_hook=_problem_hook).items())
+        else:
+            store = CheckpointStore(path)
+            try:
+                yield path, store.items()
+            finally:
+                store.close()
+
+def index_main(argv):
+    parser = argparse.ArgumentParser(prog='yibentong.py index', description='从断点存储或 JSON 建立/增量更新全文索引')
+    parser.add_argument('sources', nargs='*', metavar='PATH', help='默认当前目录下所有 problems_*.db，没有时用 problems_*.json')
+    parser.add_argument('--index', default='search_index.db', metavar='PATH')
+    parser.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args(argv)
+    sources = args.sources or sorted(glob.glob('problems_*.db')) or sorted(glob.glob('problems_*.json'))
+    if not sources:
+        print('没有找到断点存储或 JSON，请指定来源文件')
+        return 1
+    if args.rebuild and os.path.exists(args.index):
+        os.remove(args.index)
+    index = SearchIndex(args.index)
+    try:
+        t0 = time.perf_counter()
+        for path, items in _index_sources(sources):
+            changed = 0
+            batch = []
+            for pid, pdata in items:
+                batch.append((pid, pdata))
+                if len(batch) >= 500:
+                    changed += index.update_many(batch)
+                    batch = []
+            changed += index.update_many(batch)
+            print(f'{path}: 更新 {changed} 项')
+        print(f'索引 {args.index} 共 {len(index)} 道题，耗时 {time.perf_counter()-t0:.2f} 秒')
+    finally:
+        index.close()
+    return 0
+
+def search_main(argv):
+    parser = argparse.ArgumentParser(prog='yibentong.py search', description='在全文索引中检索题目')
+    parser.add_argument('query', nargs='+')
+    parser.add_argument('--index', default='search_index.db', metavar='PATH')
+    parser.add_argument('--limit', type=int, default=20, metavar='N')
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.index):
+        print(f'索引 {args.index} 不存在，请先运行: python yibentong.py index')
+        return 1
+    index = SearchIndex(args.index)
+    try:
+        t0 = time.perf_counter()
+        results = index.search(' '.join(args.query), args.limit)
+        elapsed = (time.perf_counter()-t0) * 1000
+    finally:
+        index.close()
+    for pid, title, score, snippet in results:
+        print(f'{pid}\t{score:6.2f}\t{title}\t…{snippet}…')
+    print(f'共 {len(results)} 条结果（{elapsed:.1f} ms）')
+    return 0
+
+SUBCOMMANDS = {'index': index_main, 'search': search_main}
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        return SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
     parser = argparse.ArgumentParser(description='信息学奥赛一本通题目爬取工具')
     parser.add_argument('start', type=int, nargs='?', default=1445)
     parser.add_argument('end', type=int, nargs='?', default=1445)
     parser.add_argument('--concurrent', '-c', type=int, nargs='?', const=3)
+    parser.add_argument('--async', dest='use_async', type=int, nargs='?', const=100, metavar='N')
     parser.add_argument('--resume', action='store_true')
     parser.add_argument('--json-only', action='store_true')
     parser.add_argument('--no-image', action='store_true')
     parser.add_argument('--rate', type=float, default=0.5)
+    parser.add_argument('--base-url', metavar='URL')
+    parser.add_argument('--adaptive', type=int, metavar='MAX')
+    parser.add_argument('--no-json', action='store_true')
+    parser.add_argument('--export-json', action='store_true')
+    parser.add_argument('--sql-batch', type=int, default=1, metavar='N')
+    parser.add_argument('--sql-txn', type=int, default=0, metavar='M')
+    parser.add_argument('--load', metavar='URL')
+    parser.add_argument('--load-batch', type=int, default=500, metavar='N')
+    parser.add_argument('--load-pool', type=int, default=4, metavar='N')
+    parser.add_argument('--load-data', metavar='DIR')
+    parser.add_argument('--http-cache', nargs='?', const='http_cache', metavar='DIR')
+    parser.add_argument('--cache-size', type=int, default=2048, metavar='MB')
+    parser.add_argument('--offline', action='store_true')
+    parser.add_argument('--archive', nargs='?', const='archive', metavar='DIR')
+    parser.add_argument('--image-workers', type=int, default=8, metavar='N')
+    parser.add_argument('--image-format', choices=['keep', 'png', 'webp'])
+    parser.add_argument('--image-quality', type=int, default=85, metavar='Q')
+    parser.add_argument('--image-procs', type=int, metavar='N')
+    parser.add_argument('--parser', choices=['auto', 'lxml', 'stdlib', 'bs4'], default='auto')
+    parser.add_argument('--parse-workers', type=int, nargs='?', const=0, metavar='N')
+    parser.add_argument('--reparse', action='store_true')
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--sync-state', default='sync_state.db', metavar='PATH')
+    parser.add_argument('--discover', action='store_true')
+    parser.add_argument('--known-ids', default='known_ids.db', metavar='PATH')
+    parser.add_argument('--missing-ttl', type=float, default=7, metavar='DAYS')
+    parser.add_argument('--gap', type=int, default=16, metavar='N')
+    parser.add_argument('--queue', metavar='PATH')
+    parser.add_argument('--worker-id', default=f'{socket.gethostname()}-{os.getpid()}', metavar='NAME')
+    parser.add_argument('--lease-batch', type=int, default=50, metavar='N')
+    parser.add_argument('--lease-timeout', type=float, default=600, metavar='SEC')
+    parser.add_argument('--max-attempts', type=int, default=3, metavar='N')
+    parser.add_argument('--merge', action='store_true')
+    parser.add_argument('--retry-attempts', type=int, default=4, metavar='N')
+    parser.add_argument('--retry-delay', type=float, default=2.0, metavar='SEC')
+    parser.add_argument('--breaker-threshold', type=float, default=0.5, metavar='RATIO')
+    parser.add_argument('--breaker-cooldown', type=float, default=30.0, metavar='SEC')
+    parser.add_argument('--retry-dead', action='store_true')
+    parser.add_argument('--metrics', metavar='PATH')
+    parser.add_argument('--metrics-prom', metavar='PATH')
+    parser.add_argument('--progress', type=float, default=10.0, metavar='SEC')
+    parser.add_argument('--index', nargs='?', const='search_index.db', metavar='PATH')
+    parser.add_argument('--dedup', nargs='?', const='', metavar='REPORT')
+    parser.add_argument('--dedup-threshold', type=float, default=0.8, metavar='SIM')
+    parser.add_argument('--skip-duplicates', action='store_true')
     args = parser.parse_args()
 
-    global SKIP_IMAGES, JSON_ONLY
+    global SKIP_IMAGES, JSON_ONLY, HTTP_CACHE, PARSER_BACKEND, RAW_ARCHIVE, BASE_URL, IMAGE_PROCESSOR
     SKIP_IMAGES = bool(args.no_image)
+    if args.base_url:
+        BASE_URL = args.base_url.rstrip('/')
     JSON_ONLY = bool(args.json_only)
+    PARSER_BACKEND = args.parser
 
     start_id = args.start
     end_id = args.end
     workers = args.concurrent if args.concurrent is not None else None
     use_concurrent = workers is not None
+    use_async = args.use_async is not None
     rate_delay = args.rate
+    # 指定 --parse-workers 时 SQL 也用同样数量的进程生成
+    sql_workers = (args.parse_workers or os.cpu_count() or 1) if args.parse_workers is not None else 0
+
+    def emit_sql(problems):
+        if args.dedup is not None or args.skip_duplicates:
+            t0 = time.perf_counter()
+            clusters, total = find_duplicates(problems, args.dedup_threshold)
+            report = args.dedup or f'dedup_{start_id}_{end_id}.json'
+            write_dedup_report(report, problems, clusters, total, args.dedup_threshold)
+            duplicates = {pid for _, dups in clusters for pid, _ in dups}
+            logging.info('近似重复检测：%s 道题，%s 个簇，%s 道重复，耗时 %.2f 秒，报告: %s',
+                         total, len(clusters), len(duplicates), time.perf_counter()-t0, report)
+            if args.skip_duplicates and duplicates:
+                # 每个簇只保留题号最小的一道
+                problems = SkipProblems(problems, duplicates)
+        if not args.incremental:
+            if args.load:
+                # 直接写库，不生成 SQL 文件
+                return load_problems(problems, args.load, args.load_batch, args.load_pool, args.load_data)
+            return create_sql_file(problems, start_id, end_id, args.sql_batch, args.sql_txn, sql_workers)
+        state = SyncState(args.sync_state)
+        try:
+            if args.load:
+                return load_problems(problems, args.load, args.load_batch, args.load_pool, args.load_data, state)
+            return create_incremental_sql_file(problems, start_id, end_id, state, args.sql_batch, args.sql_txn)
+        finally:
+            state.close()
 
     for d in ('data','image'):
         os.makedirs(d, exist_ok=True)
@@ -407,119 +3458,143 @@ def main():
         logger.addHandler(fh)
 
     json_file = f'problems_{start_id}_{end_id}.json'
-    completed = set()
-    if args.resume and os.path.exists(json_file):
-        try:
-            with open(json_file,'r',encoding='utf-8') as jf:
-                prev = json.load(jf)
-            for k in prev.keys():
-                try:
-                    completed.add(int(k))
-                except Exception:
-                    pass
-            logging.info('从JSON恢复，已跳过 %s 项', len(completed))
-        except Exception:
-            logging.exception('加载 JSON 失败，继续全量抓取')
-
-    ids = [pid for pid in range(start_id, end_id+1) if pid not in completed]
-    all_problems = {}
 
-    # 如果是 --json-only 模式，直接跳过爬取
+    # 如果是 --json-only 模式，直接基于 JSON 生成 SQL，不打开断点存储
     if JSON_ONLY:
         if os.path.exists(json_file):
             try:
                 with open(json_file, 'r', encoding='utf-8') as jf:
-                    all_problems = json.load(jf)
+                    all_problems = json.load(jf, object_hook=_problem_hook)
                 logging.info('--json-only 模式：仅基于现有 JSON %s 生成 SQL', json_file)
             except Exception:
                 logging.exception('加载 JSON 失败')
                 print(f'错误：找不到 {json_file}，无法进行 --json-only 模式')
                 return
+            emit_sql(all_problems)
         else:
             print(f'错误：--json-only 模式需要已有的 JSON 文件 {json_file}')
-            return
-    elif not ids:
-        if os.path.exists(json_file):
-            with open(json_file,'r',encoding='utf-8') as jf:
-                existing = json.load(jf)
-            create_sql_file(existing, start_id, end_id)
-            print('没有需要抓取的题目，已基于现有 JSON 生成 SQL')
-            return
-        else:
-            print('没有需要抓取的题目且未找到 JSON')
-            return
+        return
 
-    if not JSON_ONLY:
-        if use_concurrent:
-            w = workers if workers and workers>0 else 3
-            logging.info('使用并发： workers=%s', w)
-            results, failed = crawl_ids_concurrent(ids, max_workers=w, rate_delay=rate_delay)
-            all_problems.update(results)
-            if failed:
-                with open('failed_ids.txt','w',encoding='utf-8') as f:
-                    for fid in failed:
-                        f.write(str(fid)+'\n')
-        else:
-            sess = make_session()
-            for pid in ids:
-                pdata = crawl_problem(pid, sess)
-                if pdata and pdata.get('exists', True):
-                    save_sample_files(pdata, pid)
-                    all_problems[pid] = pdata
-                elif pdata:
-                    all_problems[pid] = pdata
-                else:
-                    all_problems[pid] = {'title': f"{pid}：题目不存在", 'description':'', 'input':'', 'output':'', 'sample_input':'', 'sample_output':'', 'time_limit':'1000','memory_limit':'32768', 'exists': False}
-                time.sleep(1)
+    if args.http_cache or args.offline:
+        HTTP_CACHE = HttpCache(args.http_cache or 'http_cache', args.cache_size*1024**2, offline=args.offline)
+        if args.offline:
+            # 离线模式只读缓存，不需要限速
+            rate_delay = 0
+            logging.info('离线模式：仅从 HTTP 缓存 %s 重建数据', HTTP_CACHE.cache_dir)
 
-    # 合并已有 JSON
-    if os.path.exists(json_file):
-        try:
-            with open(json_file,'r',encoding='utf-8') as jf:
-                prev = json.load(jf)
-            for k,v in prev.items():
-                try:
-                    ik = int(k)
-                except Exception:
-                    continue
-                if ik not in all_problems:
-                    all_problems[ik] = v
-        except Exception:
-            logging.exception('合并已有 JSON 失败')
+    if args.archive:
+        RAW_ARCHIVE = PageArchive(args.archive)
+        logging.info('原始页面和图片归档到: %s（%s 压缩）', args.archive, RAW_ARCHIVE.codec)
+
+    if args.image_format and not SKIP_IMAGES:
+        IMAGE_PROCESSOR = ImageProcessor(args.image_format, args.image_quality, args.image_procs)
+        logging.info('启用图片后处理： 格式=%s，进程数=%s', args.image_format, IMAGE_PROCESSOR.workers)
 
+    work_queue = WorkQueue(args.queue) if args.queue else None
+    queue_worker = work_queue is not None and not args.merge
+    # 队列模式下每个 worker 写自己的分片，由 --merge 合并成与单机运行相同的断点存储
+    store = CheckpointStore(work_queue.shard_path(args.worker_id) if queue_worker else f'problems_{start_id}_{end_id}.db')
+    if args.index:
+        store.search_index = SearchIndex(args.index)
     try:
-        # 确保所有 key 都转换为 int，然后按 int 排序
-        int_problems = {}
-        for k, v in all_problems.items():
+        if queue_worker:
+            work_queue.seed(range(start_id, end_id+1))
+            counts = work_queue.counts()
+            use_pipeline = args.parse_workers is not None
+            parse_workers = args.parse_workers or os.cpu_count() or 1
+            logging.info('队列 worker %s：待处理 %s，已完成 %s', args.worker_id, counts.get('pending', 0)+counts.get('leased', 0), counts.get('done', 0))
+            progress = ProgressReporter(counts.get('pending', 0)+counts.get('leased', 0), args.progress) if args.progress > 0 else nullcontext()
+            with progress:
+                run_queue_worker(work_queue, args.worker_id,
+                                 lambda ids: _run_crawl(args, ids, store, workers, use_concurrent, use_async, use_pipeline, parse_workers, rate_delay),
+                                 args.lease_batch, args.lease_timeout, args.max_attempts)
+            return
+
+        if work_queue is not None:
+            for shard in work_queue.shard_paths():
+                logging.info('已合并分片 %s: %s 项', shard, store.merge_from(shard))
+            dead = work_queue.dead_ids()
+            if dead:
+                logging.warning('多次重试仍失败的题号: %s', dead)
+            counts = work_queue.counts()
+            if counts.get('pending') or counts.get('leased'):
+                logging.warning('队列尚未处理完：待处理 %s，租用中 %s', counts.get('pending', 0), counts.get('leased', 0))
+            if not args.no_json:
+                store.export_json(json_file)
+                logging.info('已保存 JSON: %s', json_file)
+            emit_sql(store)
+            return
+
+        # 旧版本只有 JSON 快照，首次运行时导入断点存储
+        if os.path.exists(json_file) and not len(store):
             try:
-                int_key = int(k) if isinstance(k, str) else k
-                int_problems[int_key] = v
+                logging.info('已从 JSON 导入断点存储: %s 项', store.import_json(json_file))
             except Exception:
-                continue
-        dump = {str(k): v for k,v in sorted(int_problems.items())}
-        with open(json_file,'w',encoding='utf-8') as jf:
-            json.dump(dump, jf, ensure_ascii=False, indent=2)
-        logging.info('已保存 JSON: %s', json_file)
-    except Exception:
-        logging.exception('写入 JSON 失败')
+                logging.exception('导入 JSON 失败，继续全量抓取')
 
-    try:
-        with open(json_file,'r',encoding='utf-8') as jf:
-            problems_for_sql = json.load(jf)
-    except Exception:
-        problems_for_sql = all_problems
+        if args.export_json:
+            print(f'已导出 {store.export_json(json_file)} 项到: {json_file}')
+            return
 
-    # 规范图片引用
-    # SQL生成完毕
+        dead = store.dead_letters(start_id, end_id)
+        if args.retry_dead:
+            ids = [pid for pid, _, _ in dead]
+            logging.info('重试死信列表中的 %s 项', len(ids))
+        elif args.resume:
+            # 死信中的题号不在断点存储里，续爬时会重新抓取
+            ids = [pid for pid in range(start_id, end_id+1) if not store.has(pid)]
+            logging.info('从断点恢复，已跳过 %s 项，其中重试死信 %s 项', end_id-start_id+1-len(ids), len(dead))
+        else:
+            ids = list(range(start_id, end_id+1))
 
-    try:
-        # 不需要规范化图片引用 - JSON中已有正确的路径
-        # normalize_problems_image_refs(problems_for_sql)
-        pass
-    except Exception:
-        logging.exception('规范图片引用失败')
+        if not ids:
+            if not len(store):
+                print('没有需要抓取的题目且未找到 JSON')
+                return
+            if not args.no_json:
+                store.export_json(json_file)
+            emit_sql(store)
+            print('没有需要抓取的题目，已基于断点存储生成 SQL')
+            return
+
+        use_pipeline = args.parse_workers is not None
+        parse_workers = args.parse_workers or os.cpu_count() or 1
+        progress = ProgressReporter(len(ids), args.progress) if args.progress > 0 else nullcontext()
+        with progress:
+            failed = _run_crawl(args, ids, store, workers, use_concurrent, use_async, use_pipeline, parse_workers, rate_delay)
+        if failed:
+            reasons = {}
+            for _, reason, _ in store.dead_letters(start_id, end_id):
+                reasons[reason] = reasons.get(reason, 0) + 1
+            logging.warning('%s 项失败，已记入死信列表（--resume 或 --retry-dead 时重试）: %s', len(failed), reasons)
+
+        if not args.no_json:
+            try:
+                store.export_json(json_file)
+                logging.info('已保存 JSON: %s', json_file)
+            except Exception:
+                logging.exception('写入 JSON 失败')
 
-    create_sql_file(problems_for_sql, start_id, end_id)
+        emit_sql(store)
+    finally:
+        store.close()
+        if store.search_index is not None:
+            store.search_index.close()
+        if work_queue is not None:
+            work_queue.close()
+        if RAW_ARCHIVE is not None:
+            RAW_ARCHIVE.close()
+        if IMAGE_PROCESSOR is not None:
+            IMAGE_PROCESSOR.close()
+        if HTTP_CACHE is not None:
+            logging.info('HTTP 缓存：命中 %s，304 重新验证 %s，下载 %s', HTTP_CACHE.hits, HTTP_CACHE.revalidated, HTTP_CACHE.misses)
+            HTTP_CACHE.close()
+        if args.metrics:
+            METRICS.write_json(args.metrics)
+            logging.info('已写入运行指标: %s', args.metrics)
+        if args.metrics_prom:
+            METRICS.write_prometheus(args.metrics_prom)
+            logging.info('已写入 Prometheus 指标: %s', args.metrics_prom)
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())